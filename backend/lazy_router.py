@@ -0,0 +1,113 @@
+"""On-demand loading of the service routers mounted by the gateway.
+
+Importing a service pulls in its models and heavy dependencies (Pillow for
+the meal service, ``requests`` for every OpenRouter caller). A
+:class:`LazyServiceRoute` stands in for a service's routes and imports it on
+the first request to one of its paths, so a scale-to-zero replica only pays
+for the services it actually serves. The import runs in the threadpool, so
+requests to services that are already loaded are not held up meanwhile.
+"""
+from __future__ import annotations
+
+import importlib
+import sys
+import threading
+import time
+from types import ModuleType
+
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import BaseRoute, Match
+
+SERVICE_MODULES: dict[str, tuple[str, tuple[str, ...]]] = {
+    "event": ("backend.microservices.event_service.app", ("/generate-event-recommendation",)),
+    "meal": ("backend.microservices.meal_service.app", ("/analyze-meal",)),
+    "daily": ("backend.microservices.daily_analysis_service.app", ("/analyze-daily",)),
+    "coach": ("backend.microservices.coach_service.app", ("/coach",)),
+    "health": ("backend.microservices.health_service.app", ("/analyze-health",)),
+}
+_import_lock = threading.Lock()
+
+
+def import_service(name: str) -> ModuleType:
+    """Import service ``name``'s module, reporting how long a first import took.
+
+    Always goes through :func:`importlib.import_module`, which waits for a
+    module another thread is still initializing; ``sys.modules`` alone would
+    hand out a half-built module whose router lacks some routes.
+    """
+    module_path, _ = SERVICE_MODULES[name]
+    with _import_lock:
+        first = module_path not in sys.modules
+        started = time.perf_counter()
+        module = importlib.import_module(module_path)
+    if first:
+        print(f"[Gateway] loaded {name} service in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return module
+
+
+def include_service(app: FastAPI, name: str) -> None:
+    """Import service ``name`` now and include its router."""
+    app.include_router(import_service(name).router)
+
+
+class LazyServiceRoute(BaseRoute):
+    """Placeholder matching a service's path prefixes until the service is loaded."""
+
+    def __init__(self, app: FastAPI, name: str) -> None:
+        self.app = app
+        self.name = name
+        self.prefixes = SERVICE_MODULES[name][1]
+
+    def matches(self, scope) -> tuple[Match, dict]:
+        if scope["type"] == "http":
+            path = scope["path"]
+            if any(path == prefix or path.startswith(prefix + "/") for prefix in self.prefixes):
+                return Match.FULL, {}
+        return Match.NONE, {}
+
+    def load(self) -> None:
+        """Swap this placeholder for the service's real routes, in place."""
+        routes = self.app.router.routes
+        if self not in routes:
+            return
+        loaded_from = len(routes)
+        include_service(self.app, self.name)
+        service_routes = routes[loaded_from:]
+        del routes[loaded_from:]
+        index = routes.index(self)
+        routes[index:index + 1] = service_routes
+        self.app.openapi_schema = None
+
+    async def handle(self, scope, receive, send) -> None:
+        if self in self.app.router.routes:
+            # Import in a worker thread (the import lock serializes concurrent
+            # first requests), then splice on the loop, where load() cannot
+            # interleave with another splice.
+            await run_in_threadpool(import_service, self.name)
+            self.load()
+        await self.app.router.app(scope, receive, send)
+
+
+def mount_services(app: FastAPI, names: list[str], lazy: bool) -> None:
+    """Include the routers of ``names``, deferring their import when ``lazy``."""
+    placeholders: list[LazyServiceRoute] = []
+    for name in names:
+        if lazy:
+            placeholder = LazyServiceRoute(app, name)
+            app.router.routes.append(placeholder)
+            placeholders.append(placeholder)
+        else:
+            include_service(app, name)
+    if not placeholders:
+        return
+
+    build_openapi = app.openapi
+
+    def openapi() -> dict:
+        # The schema has to describe every route, so generating it loads them all.
+        for placeholder in placeholders:
+            placeholder.load()
+        return build_openapi()
+
+    app.openapi = openapi
@@ -1,34 +1,48 @@
-"""API gateway that aggregates the StressOFF microservices."""
-from __future__ import annotations
+"""API gateway that aggregates the StressOFF microservices.
 
-from fastapi import FastAPI
+``GATEWAY_SERVICES`` (comma separated, default all) selects the services this
+process serves; with ``GATEWAY_LAZY_ROUTERS=1`` (the default) each one is only
+imported on its first request, which keeps cold starts short.
+"""
+from __future__ import annotations
 
-from backend.microservices.coach_service.app import router as coach_router
-from backend.microservices.daily_analysis_service.app import router as daily_router
-from backend.microservices.event_service.app import router as event_router
-from backend.microservices.health_service.app import router as health_router
-from backend.microservices.meal_service.app import router as meal_router
+import os
 
-app = FastAPI(title="StressOFF API Gateway", version="1.0.0")
+from fastapi import FastAPI
 
-app.include_router(event_router)
-app.include_router(meal_router)
-app.include_router(daily_router)
-app.include_router(coach_router)
-app.include_router(health_router)
+from backend.lazy_router import SERVICE_MODULES, mount_services
+from backend.microservices.common.compression import CompressionMiddleware
+from backend.microservices.common.fastjson import FastJSONResponse
+from backend.microservices.common.metrics import MetricsMiddleware, metrics_router
+from backend.microservices.common.profiler import PROFILER_TOKEN, profiler_router
+from backend.microservices.common.scheduler import status_router as upstream_status_router
+from backend.microservices.common.timing import ServerTimingMiddleware, debug_router
+
+GATEWAY_SERVICES = [
+    name.strip()
+    for name in os.environ.get("GATEWAY_SERVICES", ",".join(SERVICE_MODULES)).split(",")
+    if name.strip() in SERVICE_MODULES
+]
+GATEWAY_LAZY_ROUTERS = os.environ.get("GATEWAY_LAZY_ROUTERS", "1") == "1"
+
+app = FastAPI(title="StressOFF API Gateway", version="1.0.0", default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+mount_services(app, GATEWAY_SERVICES, lazy=GATEWAY_LAZY_ROUTERS)
+app.include_router(upstream_status_router)
+app.include_router(metrics_router)
+app.include_router(debug_router)
+if PROFILER_TOKEN:
+    app.include_router(profiler_router)
 
 
 @app.get("/")
 async def root() -> dict:
     return {
         "message": "StressOFF API Gateway",
-        "services": {
-            "event": "/generate-event-recommendation",
-            "meal": "/analyze-meal",
-            "daily": "/analyze-daily",
-            "coach": "/coach",
-            "health": "/analyze-health",
-        },
+        "services": {name: SERVICE_MODULES[name][1][0] for name in GATEWAY_SERVICES},
         "documentation": {
             "event": "backend/microservices/event_service",
             "meal": "backend/microservices/meal_service",
@@ -2,18 +2,49 @@
 from __future__ import annotations
 
 import json
-import os
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
-import requests
-from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-
-OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
-
-router = APIRouter(tags=["coach"])
+from starlette.background import BackgroundTask
+
+from backend.microservices.common.compression import CompressionMiddleware
+from backend.microservices.common.fastjson import FastJSONResponse, FastJSONRoute, loads
+from backend.microservices.common.metrics import MetricsMiddleware, metrics_router, record_usage
+from backend.microservices.common.openrouter import chat_completion
+from backend.microservices.common.scheduler import (
+    Priority,
+    TicketStream,
+    request_priority,
+    status_router,
+    upstream_scheduler,
+)
+from backend.microservices.common.timing import ServerTimingMiddleware, debug_router
+
+router = APIRouter(tags=["coach"], route_class=FastJSONRoute)
+
+
+def _reframe_sse(lines: Iterable[bytes]) -> Iterator[str]:
+    """Re-frame OpenRouter SSE lines into the coach stream's ``data:`` events."""
+    for line in lines:
+        if line:
+            decoded = line.decode("utf-8")
+            if decoded.startswith("data: "):
+                data_str = decoded[6:]
+                if data_str.strip() == "[DONE]":
+                    yield "data: [DONE]\n\n"
+                    break
+                try:
+                    chunk = loads(data_str)
+                    record_usage("coach", chunk)
+                    if "choices" in chunk and len(chunk["choices"]) > 0:
+                        delta = chunk["choices"][0].get("delta", {})
+                        content = delta.get("content", "")
+                        if content:
+                            yield f"data: {json.dumps({'content': content})}\n\n"
+                except json.JSONDecodeError:
+                    continue
 
 
 class CoachingRequest(BaseModel):
@@ -24,7 +55,10 @@ class CoachingRequest(BaseModel):
 
 
 @router.post("/coach")
-async def ai_coach(request: CoachingRequest) -> StreamingResponse:
+async def ai_coach(
+    request: CoachingRequest,
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE_STREAM)),
+) -> StreamingResponse:
     try:
         profile = request.userProfile or {}
         system_prompt = f"""You are a professional AI health coach.
@@ -54,70 +88,62 @@ Guidelines:
             messages.extend(request.conversationHistory)
         messages.append({"role": "user", "content": request.message})
 
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
         data = {
-            "model": "meta-llama/llama-3.3-70b-instruct:free",
             "messages": messages,
             "temperature": 0.7,
             "max_tokens": 500,
             "stream": True,
+            "usage": {"include": True},
         }
 
+        ticket = await upstream_scheduler.admit(priority, request.userId)
+
         def generate_stream():
             try:
-                with requests.post(
-                    OPENROUTER_URL,
-                    headers=headers,
-                    json=data,
-                    stream=True,
-                    timeout=60,
-                ) as response:
+                with chat_completion("coach", data, stream=True, timeout=60) as response:
                     if not response.ok:
                         error_msg = f"OpenRouter error: {response.status_code}"
-                        yield f"data: {json.dumps({'error': error_msg})}\\n\\n"
+                        yield f"data: {json.dumps({'error': error_msg})}\n\n"
                         return
 
-                    for line in response.iter_lines():
-                        if line:
-                            decoded = line.decode("utf-8")
-                            if decoded.startswith("data: "):
-                                data_str = decoded[6:]
-                                if data_str.strip() == "[DONE]":
-                                    yield "data: [DONE]\\n\\n"
-                                    break
-                                try:
-                                    chunk = json.loads(data_str)
-                                    if "choices" in chunk and len(chunk["choices"]) > 0:
-                                        delta = chunk["choices"][0].get("delta", {})
-                                        content = delta.get("content", "")
-                                        if content:
-                                            yield f"data: {json.dumps({'content': content})}\\n\\n"
-                                except json.JSONDecodeError:
-                                    continue
+                    yield from _reframe_sse(response.iter_lines())
             except Exception as exc:
                 print(f"[CoachService] Streaming error: {exc}")
-                yield f"data: {json.dumps({'error': str(exc)})}\\n\\n"
-
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            },
-        )
+                yield f"data: {json.dumps({'error': str(exc)})}\n\n"
+
+        stream = TicketStream(ticket, generate_stream())
+        try:
+            # Closing the stream after the response also covers a body that was
+            # never iterated (client gone before the first chunk).
+            return StreamingResponse(
+                stream,
+                media_type="text/event-stream",
+                headers={
+                    "Cache-Control": "no-cache",
+                    "Connection": "keep-alive",
+                    "X-Accel-Buffering": "no",
+                },
+                background=BackgroundTask(stream.close),
+            )
+        except BaseException:
+            stream.close()
+            raise
+    except HTTPException:
+        raise
     except Exception as exc:
         print(f"[CoachService] AI Coach error: {exc}")
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="StressOFF Coach Service")
+    app = FastAPI(title="StressOFF Coach Service", default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.include_router(router)
+    app.include_router(status_router)
+    app.include_router(metrics_router)
+    app.include_router(debug_router)
 
     @app.get("/")
     async def root() -> dict[str, str]:
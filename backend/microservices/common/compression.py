@@ -0,0 +1,248 @@
+"""gzip/zstd compressed request and response bodies.
+
+:class:`CompressionMiddleware` inflates request bodies sent with
+``Content-Encoding: gzip`` (or ``zstd`` when the ``zstandard`` package is
+installed) before the app reads them, and compresses responses of at least
+``COMPRESSION_MIN_BYTES`` for clients that accept it, preferring zstd.
+Server-sent event streams are left uncompressed so every event is flushed to
+the client as soon as it is produced.
+
+Environment variables:
+
+- ``COMPRESSION_MIN_BYTES``: smallest response body worth compressing (default 1024).
+- ``MAX_DECOMPRESSED_BYTES``: limit on an inflated request body (default 32 MiB).
+"""
+from __future__ import annotations
+
+import os
+import zlib
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+MAX_DECOMPRESSED_BYTES = int(os.environ.get("MAX_DECOMPRESSED_BYTES", str(32 * 1024 * 1024)))
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+UNCOMPRESSED_TYPES = (b"text/event-stream", b"image/", b"application/zip", b"application/gzip")
+
+
+class _Gzip:
+    name = b"gzip"
+
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Zstd:
+    name = b"zstd"
+
+    def __init__(self) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail="Decompressed request body too large")
+
+
+def _malformed(detail: str = "Malformed compressed request body") -> HTTPException:
+    return HTTPException(status_code=400, detail=detail)
+
+
+class _OutputLimit:
+    """Write target of the zstd stream writer that only counts, refusing to pass ``limit`` bytes."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.limit:
+            raise _too_large()
+        return len(data)
+
+
+def _decompressor(encoding: str, limit: int = MAX_DECOMPRESSED_BYTES):
+    """Incremental decompressor for a request ``Content-Encoding``, or ``None`` if unsupported.
+
+    The returned ``inflate(data, more_body)`` raises a 413 as soon as the
+    inflated body would exceed ``limit``, without ever producing more than
+    that in memory, and a 400 for corrupt data, data after the first gzip
+    member or zstd frame, or a body that ends before it does.
+    """
+    if encoding in ("gzip", "x-gzip"):
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        inflated = 0
+
+        def inflate_gzip(data: bytes, more_body: bool) -> bytes:
+            nonlocal inflated
+            try:
+                body = inflater.decompress(data, limit - inflated + 1)
+            except zlib.error:
+                raise _malformed() from None
+            inflated += len(body)
+            # A non-empty tail means the output limit stopped inflation early.
+            if inflated > limit or inflater.unconsumed_tail:
+                raise _too_large()
+            if inflater.unused_data:
+                raise _malformed("Unexpected data after compressed request body")
+            if not more_body and not inflater.eof:
+                raise _malformed("Truncated compressed request body")
+            return body
+
+        return inflate_gzip
+    if encoding == "zstd" and zstandard is not None:
+        # The stream writer enforces the limit without holding the output;
+        # decompressobj, which never produces more than the writer has
+        # counted, builds the body and knows where the frame ends.
+        writer = zstandard.ZstdDecompressor().stream_writer(_OutputLimit(limit), write_return_read=True)
+        inflater = zstandard.ZstdDecompressor().decompressobj()
+
+        def inflate_zstd(data: bytes, more_body: bool) -> bytes:
+            try:
+                if data and inflater.eof:
+                    raise _malformed("Unexpected data after compressed request body")
+                writer.write(data)
+                body = inflater.decompress(data) if data else b""
+            except zstandard.ZstdError:
+                raise _malformed() from None
+            if inflater.unused_data:
+                raise _malformed("Unexpected data after compressed request body")
+            if not more_body and not inflater.eof:
+                raise _malformed("Truncated compressed request body")
+            return body
+
+        return inflate_zstd
+    return None
+
+
+def _accepted_encoding(accept_encoding: str):
+    """Best response encoder the client accepts (``q=0`` excluded)."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip())
+    if "zstd" in accepted and zstandard is not None:
+        return _Zstd
+    if "gzip" in accepted:
+        return _Gzip
+    return None
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware for compressed request bodies and negotiated response compression."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_encoding = headers.get(b"content-encoding", b"").decode("latin-1").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            decompress = _decompressor(content_encoding)
+            if decompress is None:
+                response = JSONResponse(
+                    {"detail": f"Unsupported Content-Encoding: {content_encoding}"},
+                    status_code=415,
+                    headers={"Accept-Encoding": "gzip, zstd" if zstandard is not None else "gzip"},
+                )
+                await response(scope, receive, send)
+                return
+            scope = {
+                **scope,
+                "headers": [
+                    (key, value) for key, value in scope["headers"] if key not in (b"content-encoding", b"content-length")
+                ],
+            }
+            receive = self._inflating_receive(receive, decompress)
+
+        encoder = _accepted_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoder is None:
+            await self.app(scope, receive, send)
+        else:
+            await self.app(scope, receive, self._compressing_send(send, encoder))
+
+    @staticmethod
+    def _inflating_receive(receive, decompress):
+        async def inflating_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                message = {**message, "body": decompress(message.get("body", b""), message.get("more_body", False))}
+            return message
+
+        return inflating_receive
+
+    def _compressing_send(self, send, encoder_class):
+        start_message = None
+        encoder = None
+
+        async def compressing_send(message) -> None:
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"")
+                if b"content-encoding" in response_headers or content_type.startswith(UNCOMPRESSED_TYPES):
+                    await send(message)
+                    return
+                # Hold the headers until the first body chunk tells whether
+                # compression is worth it.
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                encoder = encoder_class()
+                headers = [
+                    (key, value) for key, value in start_message.get("headers", []) if key.lower() != b"content-length"
+                ]
+                headers.append((b"content-encoding", encoder.name))
+                headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    compressed = encoder.compress(body) + encoder.flush()
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start_message, "headers": headers})
+
+            chunk = encoder.compress(body)
+            if not more_body:
+                chunk += encoder.flush()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        return compressing_send
@@ -0,0 +1,69 @@
+"""orjson-backed JSON encoding and decoding for the services.
+
+:class:`FastJSONResponse` is the default response class of every app and
+:class:`FastJSONRoute` parses request bodies with orjson before pydantic
+validation, which matters for full-day ``metrics`` arrays and long
+``conversationHistory`` lists. Both fall back to the standard library when
+orjson is not installed. Multipart form parsing, which receives and spools
+meal uploads, is timed as the ``upload`` Server-Timing stage.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.requests import AwaitableOrContextManagerWrapper
+
+from backend.microservices.common.timing import span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+    def form(self, **kwargs):
+        return AwaitableOrContextManagerWrapper(_timed_upload(super().form(**kwargs)))
+
+
+async def _timed_upload(form):
+    with span("upload"):
+        return await form
+
+
+class FastJSONRoute(APIRoute):
+    """Route whose handler reads JSON bodies with :func:`loads`."""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
@@ -0,0 +1,356 @@
+"""Shared OpenRouter client with latency-aware model routing.
+
+Every route (``meal``, ``health``, ``daily``, ``event``, ``coach``) owns a ranked
+pool of models. Each request goes to the currently fastest healthy model of
+its pool and falls back to the next one on 429/5xx/network errors. Model
+health is tracked with an EWMA of latency and error rate; retries, circuit
+breakers and the retry budget come from :mod:`.resilience`.
+
+Environment variables:
+
+- ``OPENROUTER_MODELS_<ROUTE>``: comma separated model pool overriding the default.
+- ``OPENROUTER_HEDGING``: ``1`` to fire a hedged request on the next model once
+  the primary exceeds its p95 latency (non-streaming calls only).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Optional
+
+import requests
+
+from backend.microservices.common.metrics import upstream_duration, upstream_in_flight, upstream_requests
+from backend.microservices.common.resilience import (
+    BreakerOpen,
+    UpstreamUnavailable,
+    breaker_for,
+    parse_retry_after,
+    retry_budget,
+    retry_policy,
+)
+from backend.microservices.common.timing import span
+
+OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+JSON_MODELS = [
+    "qwen/qwen2.5-vl-32b-instruct:free",
+    "meta-llama/llama-3.3-70b-instruct:free",
+    "mistralai/mistral-small-3.1-24b-instruct:free",
+]
+
+DEFAULT_MODEL_POOLS: dict[str, list[str]] = {
+    "meal": [
+        "qwen/qwen2.5-vl-32b-instruct:free",
+        "qwen/qwen2.5-vl-72b-instruct:free",
+        "meta-llama/llama-3.2-11b-vision-instruct:free",
+    ],
+    "health": JSON_MODELS,
+    "daily": JSON_MODELS,
+    "event": JSON_MODELS,
+    "coach": [
+        "meta-llama/llama-3.3-70b-instruct:free",
+        "mistralai/mistral-small-3.1-24b-instruct:free",
+        "qwen/qwen2.5-vl-32b-instruct:free",
+    ],
+}
+
+HEDGING_ENABLED = os.environ.get("OPENROUTER_HEDGING", "0") == "1"
+EWMA_ALPHA = 0.2
+LATENCY_PRIOR_SECONDS = 8.0
+STATS_TTL_SECONDS = 60.0
+UNHEALTHY_ERROR_RATE = 0.5
+HEDGE_MIN_SAMPLES = 20
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def _model_pool(route: str) -> list[str]:
+    override = os.environ.get(f"OPENROUTER_MODELS_{route.upper()}")
+    if override:
+        return [model.strip() for model in override.split(",") if model.strip()]
+    return list(DEFAULT_MODEL_POOLS.get(route, JSON_MODELS))
+
+
+class ModelStats:
+    """EWMA latency / error rate and a window of recent latencies for one model."""
+
+    def __init__(self) -> None:
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: deque[float] = deque(maxlen=200)
+        self.updated_at = 0.0
+
+    def record(self, latency: float, failed: bool) -> None:
+        if not failed:
+            self.latency = latency if self.latency is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+            )
+            self.samples.append(latency)
+        self.error_rate = EWMA_ALPHA * (1.0 if failed else 0.0) + (1 - EWMA_ALPHA) * self.error_rate
+        self.updated_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.updated_at > STATS_TTL_SECONDS
+
+    def healthy(self) -> bool:
+        return self.is_stale() or self.error_rate < UNHEALTHY_ERROR_RATE
+
+    def score(self) -> float:
+        """Expected latency penalised by the error rate; stale models fall back to the prior."""
+        if self.latency is None or self.is_stale():
+            return LATENCY_PRIOR_SECONDS
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def snapshot(self) -> dict:
+        return {
+            "ewmaLatency": self.latency,
+            "errorRate": round(self.error_rate, 3),
+            "p95": self.p95(),
+            "healthy": self.healthy(),
+        }
+
+
+class ModelRouter:
+    """Ranks the model pool of every route by observed latency and health."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, ModelStats] = {}
+
+    def _stats_for(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def ranked_models(self, route: str) -> list[str]:
+        pool = _model_pool(route)
+        with self._lock:
+            return sorted(
+                pool,
+                key=lambda model: (
+                    not self._stats_for(model).healthy(),
+                    self._stats_for(model).score(),
+                    pool.index(model),
+                ),
+            )
+
+    def record(self, model: str, latency: float, failed: bool) -> None:
+        with self._lock:
+            self._stats_for(model).record(latency, failed)
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        with self._lock:
+            return self._stats_for(model).p95()
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {model: stats.snapshot() for model, stats in self._stats.items()}
+
+
+model_router = ModelRouter()
+_session = requests.Session()
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="openrouter-hedge")
+
+
+def _headers() -> dict[str, str]:
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def _send(route: str, model: str, payload: dict, stream: bool, timeout: Optional[float]) -> requests.Response:
+    """Send one attempt to ``model`` and record its outcome.
+
+    Raises :class:`BreakerOpen` without sending when another call took the
+    model's half-open probe since it was picked.
+    """
+    breaker = breaker_for(model)
+    if not breaker.acquire():
+        raise BreakerOpen(model)
+    started = time.perf_counter()
+    upstream_in_flight.inc(route=route)
+    try:
+        response = _session.post(
+            OPENROUTER_URL,
+            headers=_headers(),
+            json={**payload, "model": model},
+            stream=stream,
+            timeout=timeout,
+        )
+    except requests.RequestException:
+        elapsed = time.perf_counter() - started
+        model_router.record(model, elapsed, failed=True)
+        upstream_requests.inc(route=route, model=model, status="error")
+        upstream_duration.observe(elapsed, route=route, model=model)
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    finally:
+        upstream_in_flight.dec(route=route)
+    elapsed = time.perf_counter() - started
+    failed = response.status_code in RETRYABLE_STATUSES
+    model_router.record(model, elapsed, failed=failed)
+    upstream_requests.inc(route=route, model=model, status=str(response.status_code))
+    upstream_duration.observe(elapsed, route=route, model=model)
+    if failed:
+        breaker.record_failure(open_for=parse_retry_after(response.headers.get("Retry-After")))
+    else:
+        breaker.record_success()
+    return response
+
+
+def _discard(future: Future) -> None:
+    """Close the response of a hedged attempt that lost the race."""
+    if future.cancel():
+        return
+
+    def close(done: Future) -> None:
+        if done.exception() is None:
+            done.result().close()
+
+    future.add_done_callback(close)
+
+
+def _send_hedged(
+    route: str,
+    model: str,
+    pick_hedge,
+    payload: dict,
+    timeout: Optional[float],
+) -> requests.Response:
+    """Send to ``model`` and hedge on ``pick_hedge()`` once the primary exceeds its p95.
+
+    The first non-retryable response wins. If both fail, the primary's outcome
+    is returned or raised. Every attempt that is not returned is cancelled or
+    has its response closed, so no pooled connection is left checked out.
+    """
+    primary = _hedge_executor.submit(_send, route, model, payload, False, timeout)
+    delay = model_router.hedge_delay(model)
+    done, _ = wait([primary], timeout=delay)
+    hedge_model = None if done else pick_hedge()
+    if hedge_model is None:
+        return primary.result()
+
+    print(f"[OpenRouter] hedging {model} with {hedge_model} after {delay:.2f}s")
+    hedge = _hedge_executor.submit(_send, route, hedge_model, payload, False, timeout)
+    winner = primary
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        succeeded = [
+            future for future in done
+            if future.exception() is None and future.result().status_code not in RETRYABLE_STATUSES
+        ]
+        if succeeded:
+            winner = succeeded[0]
+            break
+    _discard(hedge if winner is primary else primary)
+    return winner.result()
+
+
+def _next_model(models: list[str], tried: set[str]) -> Optional[str]:
+    """Best ranked model whose breaker lets a call through, preferring untried ones.
+
+    Only checks the breakers: the probe of a half-open one is claimed by
+    :func:`_send`, so picking a model that is then not called holds nothing.
+    """
+    for candidates in ([m for m in models if m not in tried], [m for m in models if m in tried]):
+        for model in candidates:
+            if breaker_for(model).allow():
+                return model
+    return None
+
+
+def chat_completion(
+    route: str,
+    payload: dict,
+    *,
+    stream: bool = False,
+    timeout: Optional[float] = None,
+) -> requests.Response:
+    """POST a chat completion for ``route`` to the best model of its pool.
+
+    ``payload`` is the OpenRouter request body without ``model``. Failed
+    attempts (429/5xx/network errors) move on to the next ranked model, or back
+    off with jitter before retrying an already tried one, within the attempt
+    limit and the global retry budget. Models with an open circuit breaker are
+    skipped; if none is callable, :class:`UpstreamUnavailable` is raised.
+    Otherwise the last response is returned (or the last error re-raised) so
+    callers keep their own error mapping.
+    """
+    with span("upstream"):
+        return _chat_completion(route, payload, stream, timeout)
+
+
+def _chat_completion(route: str, payload: dict, stream: bool, timeout: Optional[float]) -> requests.Response:
+    retry_budget.record_request()
+    models = model_router.ranked_models(route)
+    tried: set[str] = set()
+    last_response: Optional[requests.Response] = None
+    last_error: Optional[BaseException] = None
+    retry_after: Optional[float] = None
+
+    for attempt in range(retry_policy.max_attempts):
+        model = _next_model(models, tried)
+        if model is None:
+            if attempt == 0:
+                raise UpstreamUnavailable(min(breaker_for(m).retry_in() for m in models))
+            break
+        if attempt > 0:
+            if not retry_budget.try_acquire():
+                print(f"[OpenRouter] {route} retry budget exhausted")
+                break
+            if model in tried:
+                delay = retry_policy.backoff(attempt - 1, retry_after)
+                if delay is None:
+                    break
+                time.sleep(delay)
+        tried.add(model)
+
+        def pick_hedge() -> Optional[str]:
+            hedge_model = _next_model([m for m in models if m not in tried], set())
+            if hedge_model is None or not retry_budget.try_acquire():
+                return None
+            tried.add(hedge_model)
+            return hedge_model
+
+        try:
+            if HEDGING_ENABLED and not stream:
+                response = _send_hedged(route, model, pick_hedge, payload, timeout)
+            else:
+                response = _send(route, model, payload, stream, timeout)
+        except BreakerOpen:
+            continue
+        except requests.RequestException as exc:
+            print(f"[OpenRouter] {route} attempt on {model} failed: {exc}")
+            last_error = exc
+            continue
+        if response.status_code not in RETRYABLE_STATUSES:
+            if last_response is not None:
+                last_response.close()
+            return response
+        print(f"[OpenRouter] {route} attempt on {model} failed with {response.status_code}")
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if last_response is not None:
+            last_response.close()
+        last_response = response
+
+    if last_response is not None:
+        return last_response
+    if last_error is not None:
+        raise last_error
+    raise UpstreamUnavailable(min(breaker_for(m).retry_in() for m in models))
@@ -0,0 +1,110 @@
+"""On-demand statistical profiler for a live process.
+
+A background thread samples the stacks of every thread (the event loop and
+the executor threads) with :func:`sys._current_frames` at a fixed interval
+and aggregates them into collapsed stacks (``thread;frame;frame count``),
+ready for ``flamegraph.pl`` or speedscope. Nothing runs until a profile is
+requested, and the router is only mounted when ``PROFILER_TOKEN`` is set.
+"""
+from __future__ import annotations
+
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN")
+MAX_PROFILE_SECONDS = 120.0
+
+# Leaf frames of threads that are parked rather than running Python code.
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_thread.py", "_worker"),
+    ("base_events.py", "_run_once"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """Samples all thread stacks every ``interval`` seconds for ``duration`` seconds."""
+
+    def __init__(self, interval: float, include_idle: bool) -> None:
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+    def run(self, duration: float) -> None:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        next_tick = time.monotonic()
+        while next_tick < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (not self.include_idle and _is_idle(frame)):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_profile_lock = threading.Lock()
+
+profiler_router = APIRouter(tags=["debug"])
+
+
+@profiler_router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    idle: bool = Query(False, description="also count threads parked in select/wait/queue.get"),
+    x_profiler_token: Optional[str] = Header(None),
+) -> PlainTextResponse:
+    """Profile the running process for ``seconds`` and return collapsed stacks."""
+    if not PROFILER_TOKEN or not x_profiler_token or not hmac.compare_digest(
+        x_profiler_token.encode("utf-8"), PROFILER_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid profiler token")
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        sampler = SamplingProfiler(interval_ms / 1000, include_idle=idle)
+        print(f"[Profiler] sampling every {interval_ms:.0f} ms for {seconds:.0f} s")
+        await run_in_threadpool(sampler.run, seconds)
+    finally:
+        _profile_lock.release()
+    return PlainTextResponse(
+        sampler.collapsed(),
+        headers={"X-Profile-Samples": str(sampler.samples), "X-Profile-Interval-Ms": f"{interval_ms:g}"},
+    )
@@ -0,0 +1,196 @@
+"""Retry, circuit breaker and retry budget policies for upstream calls.
+
+Environment variables:
+
+- ``OPENROUTER_MAX_ATTEMPTS``: total attempts per call, fallbacks included (default 3).
+- ``OPENROUTER_RETRY_BUDGET``: share of retries allowed on top of first attempts (default 0.2).
+- ``OPENROUTER_BREAKER_FAILURES``: consecutive failures that open a model's breaker (default 5).
+- ``OPENROUTER_BREAKER_RESET``: seconds a breaker stays open before a probe (default 30).
+"""
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+class BreakerOpen(Exception):
+    """Raised instead of sending when a model's breaker no longer lets the call through."""
+
+
+class UpstreamUnavailable(HTTPException):
+    """Raised when no upstream model may be called right now."""
+
+    def __init__(self, retry_after: float, detail: str = "The AI provider is temporarily unavailable. Please retry later.") -> None:
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours ``Retry-After``."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, retry: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Delay before the ``retry``-th retry, or ``None`` if waiting is not worth it."""
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+
+class CircuitBreaker:
+    """Per-model breaker: closed, open after N consecutive failures, then half-open."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go through right now, without claiming anything."""
+        with self._lock:
+            state = self._state()
+            return state == "closed" or (state == "half_open" and not self._probing)
+
+    def acquire(self) -> bool:
+        """Claim the right to send a call; half-open lets a single probe pass.
+
+        Call it right before sending: a claimed probe is only given back by
+        :meth:`record_success`, :meth:`record_failure` or :meth:`release`.
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a claimed probe whose call ended without an outcome."""
+        with self._lock:
+            self._probing = False
+
+    def retry_in(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self, open_for: Optional[float] = None) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                # Retry-After from the provider extends the open period if longer.
+                delay = max(self.reset_timeout, open_for or 0.0)
+                self._opened_at = time.monotonic() - self.reset_timeout + delay
+            self._probing = False
+
+
+class RetryBudget:
+    """Caps retries to a fraction of first attempts over a sliding window."""
+
+    def __init__(self, ratio: float = 0.2, window: float = 10.0, min_retries: int = 3) -> None:
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._lock = threading.Lock()
+        self._requests: deque[float] = deque()
+        self._retries: deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_acquire(self) -> bool:
+        """Reserve one retry if the budget allows it."""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            allowed = self.min_retries + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+retry_policy = RetryPolicy(max_attempts=int(os.environ.get("OPENROUTER_MAX_ATTEMPTS", "3")))
+retry_budget = RetryBudget(ratio=float(os.environ.get("OPENROUTER_RETRY_BUDGET", "0.2")))
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(
+                failure_threshold=int(os.environ.get("OPENROUTER_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.environ.get("OPENROUTER_BREAKER_RESET", "30")),
+            )
+        return breaker
+
+
+def retry_after_headers(response) -> Optional[dict[str, str]]:
+    """Forward the upstream ``Retry-After`` header to our own clients."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    return {"Retry-After": value} if value else None
@@ -0,0 +1,457 @@
+"""Admission control and priority scheduling for upstream OpenRouter calls.
+
+All routes share one scarce upstream quota. Every call is admitted through
+:data:`upstream_scheduler`, which enforces:
+
+- a global concurrency cap (``UPSTREAM_MAX_CONCURRENCY``, default 8);
+- a per-user token bucket (``UPSTREAM_USER_RATE`` calls/s, ``UPSTREAM_USER_BURST``);
+- strict priority between classes: interactive streaming, then interactive
+  request/response, then background batch work;
+- fair share within a class: waiting users are served round-robin, each
+  user's own calls in FIFO order, so one user's burst cannot hold the queue.
+
+Callers that cannot be admitted within their class's bounded wait are shed
+with a 429 (per-user limit) or 503 (saturated) carrying ``Retry-After``.
+Handlers wait for admission on the event loop and only then hand the blocking
+upstream call to the threadpool (:meth:`UpstreamScheduler.run`), so queued
+requests never tie up worker threads. The slot is released by the thread
+that made the call, once it is over, and never early because the client left;
+streaming endpoints wrap their body in a :class:`TicketStream` for the same reason.
+Clients can downgrade a request with ``X-Request-Priority: background``.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Callable, Iterator, Optional, TypeVar
+
+from fastapi import APIRouter, Header, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from backend.microservices.common.metrics import registry
+from backend.microservices.common.timing import span
+
+
+class Priority(IntEnum):
+    INTERACTIVE_STREAM = 0
+    INTERACTIVE = 1
+    BACKGROUND = 2
+
+
+MAX_WAIT_SECONDS = {
+    Priority.INTERACTIVE_STREAM: float(os.environ.get("UPSTREAM_MAX_WAIT_STREAM", "10")),
+    Priority.INTERACTIVE: float(os.environ.get("UPSTREAM_MAX_WAIT_INTERACTIVE", "20")),
+    Priority.BACKGROUND: float(os.environ.get("UPSTREAM_MAX_WAIT_BACKGROUND", "120")),
+}
+MAX_QUEUE_DEPTH = {
+    Priority.INTERACTIVE_STREAM: 64,
+    Priority.INTERACTIVE: 128,
+    Priority.BACKGROUND: 512,
+}
+
+T = TypeVar("T")
+
+
+class AdmissionRejected(HTTPException):
+    """Raised when an upstream call is shed instead of queued."""
+
+    def __init__(self, status_code: int, retry_after: float, detail: str) -> None:
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take one token and return how long the caller must wait for it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class _ClassStats:
+    def __init__(self) -> None:
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: deque[float] = deque(maxlen=200)
+
+    def snapshot(self, depth: int) -> dict:
+        ordered = sorted(self.recent_waits)
+        return {
+            "queueDepth": depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avgWaitSeconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "p95WaitSeconds": round(ordered[int(len(ordered) * 0.95) - 1], 4) if len(ordered) >= 20 else None,
+            "maxWaitSeconds": round(self.max_wait, 4),
+        }
+
+
+class Ticket:
+    """Admission to the upstream; release it once the call (or stream) is over.
+
+    Releasing is idempotent, so a streaming endpoint can release both from its
+    generator and from a background task that runs even if the body never starts.
+    """
+
+    def __init__(self, scheduler: "UpstreamScheduler") -> None:
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self) -> None:
+        self._scheduler._release(self)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class TicketStream:
+    """Sync SSE body that holds ``ticket`` for as long as its generator runs.
+
+    ``StreamingResponse`` iterates it in the threadpool. The ticket is released
+    when the generator finishes, or by :meth:`close`, meant to run as the
+    response's background task: it waits for a read still in progress,
+    closes the generator (and with it the upstream response), then releases.
+    A disconnected client therefore never frees the slot while the upstream
+    call is still running.
+    """
+
+    def __init__(self, ticket: Ticket, generator: Iterator[str]) -> None:
+        self._ticket = ticket
+        self._generator = generator
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> "TicketStream":
+        return self
+
+    def __next__(self) -> str:
+        with self._lock:
+            try:
+                return next(self._generator)
+            except BaseException:
+                self._ticket.release()
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._generator.close()
+            finally:
+                self._ticket.release()
+
+    def __del__(self) -> None:
+        self._ticket.release()
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # The caller may have stopped waiting; mark the outcome as seen.
+    if not future.cancelled():
+        future.exception()
+
+
+class _Waiter:
+    """A queued admission, woken on its event loop or, for blocking callers, through an event."""
+
+    def __init__(self, priority: Priority, user_id: Optional[str], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        self.priority = priority
+        self.user_id = user_id
+        self.granted = False
+        self.loop = loop
+        if loop is not None:
+            self.future = loop.create_future()
+        else:
+            self.event = threading.Event()
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_set_done, self.future)
+
+
+def _set_done(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _FairQueue:
+    """Waiters of one priority class: round-robin between users, FIFO per user.
+
+    Anonymous calls share one lane. Lanes live in insertion order, and a lane
+    that still has waiters after its head is served moves to the back.
+    """
+
+    def __init__(self) -> None:
+        self._lanes: dict[Optional[str], deque[_Waiter]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, waiter: _Waiter) -> None:
+        self._lanes.setdefault(waiter.user_id, deque()).append(waiter)
+        self._size += 1
+
+    def popleft(self) -> _Waiter:
+        user_id, lane = next(iter(self._lanes.items()))
+        waiter = lane.popleft()
+        del self._lanes[user_id]
+        if lane:
+            self._lanes[user_id] = lane
+        self._size -= 1
+        return waiter
+
+    def remove(self, waiter: _Waiter) -> None:
+        lane = self._lanes[waiter.user_id]
+        lane.remove(waiter)
+        if not lane:
+            del self._lanes[waiter.user_id]
+        self._size -= 1
+
+
+class UpstreamScheduler:
+    """Strict-priority, per-user round-robin admission, awaited on the event loop.
+
+    Waiting callers never hold a worker thread: a queued request is a future
+    that :meth:`_dispatch` completes when a slot frees up. State is guarded by
+    a plain lock because tickets are also released from threadpool threads
+    (upstream calls and streaming bodies) and the SWR refresh threads.
+    """
+
+    def __init__(self, max_concurrency: int, user_rate: float, user_burst: float) -> None:
+        self.max_concurrency = max_concurrency
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues: dict[Priority, _FairQueue] = {priority: _FairQueue() for priority in Priority}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._stats = {priority: _ClassStats() for priority in Priority}
+
+    def _reject(self, priority: Priority, status_code: int, retry_after: float, detail: str) -> AdmissionRejected:
+        self._stats[priority].rejected += 1
+        return AdmissionRejected(status_code, retry_after, detail)
+
+    def _refund(self, bucket: Optional[TokenBucket]) -> None:
+        if bucket is not None:
+            with self._lock:
+                bucket.refund()
+
+    def _busy(self, priority: Priority, bucket: Optional[TokenBucket]) -> AdmissionRejected:
+        # Called with the lock held, or with bucket=None.
+        if bucket is not None:
+            bucket.refund()
+        return self._reject(priority, 503, MAX_WAIT_SECONDS[priority], "The AI service is busy. Please retry later.")
+
+    def _reserve(self, priority: Priority, user_id: Optional[str]) -> tuple[Optional[TokenBucket], float]:
+        """Take the user's token and check the queue bound; returns the bucket and the user's own wait."""
+        with self._lock:
+            bucket = None
+            user_wait = 0.0
+            if user_id:
+                bucket = self._buckets.get(user_id)
+                if bucket is None:
+                    bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+                user_wait = bucket.reserve()
+                if user_wait > MAX_WAIT_SECONDS[priority]:
+                    bucket.refund()
+                    raise self._reject(
+                        priority, 429, user_wait, "Too many AI requests for this user. Please slow down."
+                    )
+            if len(self._queues[priority]) >= MAX_QUEUE_DEPTH[priority]:
+                raise self._busy(priority, bucket)
+        return bucket, user_wait
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        with self._lock:
+            self._queues[waiter.priority].append(waiter)
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the heads of the queues, highest priority first (lock held)."""
+        while self._active < self.max_concurrency:
+            queue = next((self._queues[level] for level in Priority if self._queues[level]), None)
+            if queue is None:
+                return
+            waiter = queue.popleft()
+            waiter.granted = True
+            self._active += 1
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter, bucket: Optional[TokenBucket]) -> bool:
+        """Withdraw a waiter that gave up; returns True if it had been granted in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queues[waiter.priority].remove(waiter)
+            if bucket is not None:
+                bucket.refund()
+            self._dispatch()
+            return False
+
+    def _admitted(self, priority: Priority, started: float) -> Ticket:
+        waited = time.monotonic() - started
+        with self._lock:
+            stats = self._stats[priority]
+            stats.admitted += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            stats.recent_waits.append(waited)
+        return Ticket(self)
+
+    async def admit(self, priority: Priority = Priority.INTERACTIVE, user_id: Optional[str] = None) -> Ticket:
+        """Wait on the event loop until the call may go upstream, or raise :class:`AdmissionRejected`."""
+        with span("queue"):
+            started = time.monotonic()
+            deadline = started + MAX_WAIT_SECONDS[priority]
+            bucket, user_wait = self._reserve(priority, user_id)
+            # Wait out the user's own rate limit before queueing, so a throttled
+            # user never holds the head of the queue.
+            if user_wait > 0:
+                try:
+                    await asyncio.sleep(user_wait)
+                except BaseException:
+                    self._refund(bucket)
+                    raise
+
+            waiter = _Waiter(priority, user_id, asyncio.get_running_loop())
+            self._enqueue(waiter)
+            try:
+                await asyncio.wait_for(waiter.future, timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter, bucket):
+                    raise self._busy(priority, None) from None
+            except BaseException:
+                # Cancelled (client gone): give back the slot if it was just granted.
+                if self._abandon(waiter, bucket):
+                    self._release(Ticket(self))
+                raise
+            return self._admitted(priority, started)
+
+    def admit_blocking(self, priority: Priority = Priority.BACKGROUND, user_id: Optional[str] = None) -> Ticket:
+        """Blocking :meth:`admit` for dedicated threads outside the request threadpool (SWR refreshes)."""
+        started = time.monotonic()
+        deadline = started + MAX_WAIT_SECONDS[priority]
+        bucket, user_wait = self._reserve(priority, user_id)
+        if user_wait > 0:
+            time.sleep(user_wait)
+        waiter = _Waiter(priority, user_id, None)
+        self._enqueue(waiter)
+        if not waiter.event.wait(timeout=max(0.0, deadline - time.monotonic())):
+            if not self._abandon(waiter, bucket):
+                raise self._busy(priority, None)
+        return self._admitted(priority, started)
+
+    async def run(
+        self,
+        func: Callable[..., T],
+        *args,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id: Optional[str] = None,
+    ) -> T:
+        """Admit, then run the blocking ``func(*args)`` in the threadpool under the ticket.
+
+        The worker thread releases the ticket once ``func`` returns. The call
+        is shielded: a cancelled caller (client gone) stops waiting for the
+        result, but the slot stays taken until the upstream call is over.
+        """
+        ticket = await self.admit(priority, user_id)
+
+        def call() -> T:
+            with ticket:
+                return func(*args)
+
+        future = asyncio.ensure_future(run_in_threadpool(call))
+        future.add_done_callback(_retrieve)
+        return await asyncio.shield(future)
+
+    def _release(self, ticket: Ticket) -> None:
+        with self._lock:
+            if ticket._released:
+                return
+            ticket._released = True
+            self._active -= 1
+            self._dispatch()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "maxConcurrency": self.max_concurrency,
+                "classes": {
+                    priority.name.lower(): self._stats[priority].snapshot(len(self._queues[priority]))
+                    for priority in Priority
+                },
+            }
+
+
+upstream_scheduler = UpstreamScheduler(
+    max_concurrency=int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "8")),
+    user_rate=float(os.environ.get("UPSTREAM_USER_RATE", "0.2")),
+    user_burst=float(os.environ.get("UPSTREAM_USER_BURST", "5")),
+)
+
+
+def _scheduler_metrics() -> list[str]:
+    snapshot = upstream_scheduler.snapshot()
+    lines = [
+        "# HELP stressoff_scheduler_active Upstream calls currently admitted.",
+        "# TYPE stressoff_scheduler_active gauge",
+        f"stressoff_scheduler_active {snapshot['active']}",
+    ]
+    for name, kind, field in (
+        ("stressoff_scheduler_queue_depth", "gauge", "queueDepth"),
+        ("stressoff_scheduler_admitted_total", "counter", "admitted"),
+        ("stressoff_scheduler_rejected_total", "counter", "rejected"),
+    ):
+        lines.append(f"# TYPE {name} {kind}")
+        for priority, stats in snapshot["classes"].items():
+            lines.append(f'{name}{{priority="{priority}"}} {stats[field]}')
+    return lines
+
+
+registry.add_collector(_scheduler_metrics)
+
+
+def request_priority(default: Priority):
+    """Dependency returning ``default``, or a lower priority requested by the client."""
+
+    def dependency(x_request_priority: Optional[str] = Header(None)) -> Priority:
+        if x_request_priority:
+            requested = Priority.__members__.get(x_request_priority.strip().upper().replace("-", "_"))
+            if requested is not None and requested > default:
+                return requested
+        return default
+
+    return dependency
+
+
+status_router = APIRouter(tags=["upstream"])
+
+
+@status_router.get("/upstream/scheduler")
+async def scheduler_status() -> dict:
+    """Queue depth, wait times and shed counts for every priority class."""
+    return upstream_scheduler.snapshot()
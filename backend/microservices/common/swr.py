@@ -0,0 +1,105 @@
+"""Stale-while-revalidate cache for LLM-generated analyses.
+
+Entries are keyed per ``(userId, date)``. A cached value younger than
+``SWR_FRESH_SECONDS`` (default 300) is served as-is; an older one, up to
+``SWR_MAX_STALE_SECONDS`` (default 6 hours), is served immediately while a
+single background refresh per key runs in a small thread pool.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Hashable, Optional
+
+SWR_FRESH_SECONDS = float(os.environ.get("SWR_FRESH_SECONDS", "300"))
+SWR_MAX_STALE_SECONDS = float(os.environ.get("SWR_MAX_STALE_SECONDS", str(6 * 3600)))
+
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+
+
+class StaleWhileRevalidateCache:
+    def __init__(
+        self,
+        name: str,
+        fresh_seconds: float = SWR_FRESH_SECONDS,
+        max_stale_seconds: float = SWR_MAX_STALE_SECONDS,
+        max_entries: int = 10_000,
+    ) -> None:
+        self.name = name
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[dict, float]] = OrderedDict()
+        self._refreshing: set[Hashable] = set()
+
+    def put(self, key: Hashable, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[tuple[dict, float]]:
+        """Return ``(value, age_seconds)`` unless missing or older than the max stale age."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age > self.max_stale_seconds:
+                del self._entries[key]
+                return None
+            return value, age
+
+    def revalidate(self, key: Hashable, refresh: Callable[[], dict]) -> bool:
+        """Refresh ``key`` in the background; returns False if a refresh is already in flight."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def run() -> None:
+            try:
+                self.put(key, refresh())
+            except Exception as exc:
+                print(f"[SWR] {self.name} refresh of {key} failed: {exc}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        _refresh_executor.submit(run)
+        return True
+
+    def is_refreshing(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._refreshing
+
+    def serve(self, key: Hashable, refresh: Callable[[], dict]) -> Optional[tuple[dict, dict]]:
+        """Return the cached value and its freshness, revalidating it if it is stale.
+
+        Returns ``None`` when there is nothing usable cached for ``key``.
+        """
+        cached = self.get(key)
+        if cached is None:
+            return None
+        value, age = cached
+        stale = age >= self.fresh_seconds
+        if stale:
+            self.revalidate(key, refresh)
+        return value, freshness(age, stale=stale, revalidating=self.is_refreshing(key))
+
+
+def freshness(age: float, stale: bool = False, revalidating: bool = False) -> dict:
+    generated_at = datetime.fromtimestamp(time.time() - age, tz=timezone.utc)
+    return {
+        "stale": stale,
+        "ageSeconds": round(age, 1),
+        "generatedAt": generated_at.isoformat(),
+        "revalidating": revalidating,
+    }
@@ -0,0 +1,97 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from backend.microservices.common.compression import CompressionMiddleware, _decompressor
+
+BODY = b'{"heartRate": 72}' * 1000
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.post("/echo")
+    async def echo(request: Request) -> dict:
+        return {"length": len(await request.body())}
+
+    return app
+
+
+def _inflate(encoding: str, compressed: bytes, limit: int, chunk: int = 100) -> bytes:
+    inflate = _decompressor(encoding, limit)
+    chunks = [compressed[i:i + chunk] for i in range(0, len(compressed), chunk)]
+    return b"".join(inflate(data, index < len(chunks) - 1) for index, data in enumerate(chunks))
+
+
+def test_gzip_body_is_inflated_in_chunks():
+    assert _inflate("gzip", gzip.compress(BODY), len(BODY)) == BODY
+
+
+def test_gzip_over_limit_is_rejected_with_bounded_output():
+    bomb = gzip.compress(b"\0" * (64 * 1024 * 1024))
+    inflate = _decompressor("gzip", 1024)
+    with pytest.raises(HTTPException) as raised:
+        inflate(bomb, False)
+    assert raised.value.status_code == 413
+
+
+@pytest.mark.parametrize("kept", [0.99, 0.9, 0.5])
+def test_truncated_gzip_is_rejected(kept):
+    compressed = gzip.compress(BODY)
+    with pytest.raises(HTTPException) as raised:
+        _inflate("gzip", compressed[: int(len(compressed) * kept)], len(BODY))
+    assert raised.value.status_code == 400
+
+
+def test_data_after_gzip_member_is_rejected():
+    with pytest.raises(HTTPException) as raised:
+        _inflate("gzip", gzip.compress(BODY) + b"trailing", len(BODY))
+    assert raised.value.status_code == 400
+
+
+def test_corrupt_gzip_is_rejected():
+    with pytest.raises(HTTPException) as raised:
+        _inflate("gzip", b"\x1f\x8b" + b"\xff" * 50, len(BODY))
+    assert raised.value.status_code == 400
+
+
+def test_zstd_body_limit_and_truncation():
+    zstandard = pytest.importorskip("zstandard")
+    compressed = zstandard.ZstdCompressor().compress(BODY)
+    assert _inflate("zstd", compressed, len(BODY)) == BODY
+
+    with pytest.raises(HTTPException) as raised:
+        _inflate("zstd", compressed[: len(compressed) // 2], len(BODY))
+    assert raised.value.status_code == 400
+
+    bomb = zstandard.ZstdCompressor(level=19).compress(b"\0" * (64 * 1024 * 1024))
+    with pytest.raises(HTTPException) as raised:
+        _inflate("zstd", bomb, 1024, chunk=len(bomb))
+    assert raised.value.status_code == 413
+
+
+def test_middleware_rejects_truncated_and_unknown_encodings():
+    client = TestClient(_app())
+    compressed = gzip.compress(BODY)
+
+    response = client.post("/echo", content=compressed, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.json() == {"length": len(BODY)}
+
+    response = client.post("/echo", content=compressed[: len(compressed) // 2], headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Truncated compressed request body"
+
+    response = client.post("/echo", content=BODY, headers={"Content-Encoding": "br"})
+    assert response.status_code == 415
+
+
+def test_middleware_compresses_large_responses_for_gzip_clients():
+    client = TestClient(_app())
+    response = client.post("/echo", content=BODY, headers={"Accept-Encoding": "gzip"})
+    # Below COMPRESSION_MIN_BYTES the response is sent as is.
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"length": len(BODY)}
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from backend.microservices.common import openrouter
+
+
+class FakeResponse:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+        self.headers = {}
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def attempts(monkeypatch):
+    """Fake ``_send``: each model answers with its scripted status after its delay."""
+    script: dict[str, tuple[float, int]] = {}
+    sent: dict[str, FakeResponse] = {}
+
+    def send(route, model, payload, stream, timeout):
+        delay, status = script[model]
+        time.sleep(delay)
+        response = sent[model] = FakeResponse(status)
+        return response
+
+    monkeypatch.setattr(openrouter, "_send", send)
+    monkeypatch.setattr(openrouter.model_router, "hedge_delay", lambda model: 0.02)
+    return script, sent
+
+
+def _hedged(script, primary_model="primary", hedge_model="hedge"):
+    return openrouter._send_hedged("health", primary_model, lambda: hedge_model, {}, None)
+
+
+def _wait_closed(sent: dict[str, FakeResponse], model: str) -> bool:
+    """Whether the response of ``model``, which may still be on its way, ends up closed."""
+    for _ in range(100):
+        if model in sent and sent[model].closed:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_fast_primary_is_not_hedged(attempts):
+    script, sent = attempts
+    script.update(primary=(0.0, 200), hedge=(0.0, 200))
+    response = _hedged(script)
+    assert response is sent["primary"]
+    assert "hedge" not in sent
+
+
+def test_winning_hedge_closes_the_slow_primary(attempts):
+    script, sent = attempts
+    script.update(primary=(0.2, 200), hedge=(0.0, 200))
+    response = _hedged(script)
+    assert response is sent["hedge"]
+    assert not response.closed
+    assert _wait_closed(sent, "primary")
+
+
+def test_winning_hedge_closes_a_retryable_primary(attempts):
+    script, sent = attempts
+    script.update(primary=(0.05, 503), hedge=(0.1, 200))
+    response = _hedged(script)
+    assert response is sent["hedge"]
+    assert sent["primary"].closed
+
+
+def test_both_failing_returns_the_primary_and_closes_the_hedge(attempts):
+    script, sent = attempts
+    script.update(primary=(0.05, 503), hedge=(0.0, 429))
+    response = _hedged(script)
+    assert response is sent["primary"]
+    assert not response.closed
+    assert sent["hedge"].closed
+
+
+def test_retries_close_every_response_they_do_not_return(attempts, monkeypatch):
+    script, sent = attempts
+    models = ["test-model-a", "test-model-b", "test-model-c"]
+    script.update({"test-model-a": (0.0, 503), "test-model-b": (0.0, 502), "test-model-c": (0.0, 200)})
+    monkeypatch.setattr(openrouter.model_router, "ranked_models", lambda route: list(models))
+    response = openrouter._chat_completion("health", {}, False, None)
+    assert response is sent["test-model-c"]
+    assert sent["test-model-a"].closed
+    assert sent["test-model-b"].closed
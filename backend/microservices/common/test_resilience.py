@@ -0,0 +1,91 @@
+import time
+
+from backend.microservices.common.resilience import CircuitBreaker, RetryBudget, RetryPolicy, parse_retry_after
+
+
+def _open_breaker(reset_timeout: float = 0.05) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert not breaker.acquire()
+    assert 29 < breaker.retry_in() <= 30
+
+
+def test_half_open_breaker_lets_a_single_probe_through():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    # allow() only checks: it never claims the probe.
+    assert breaker.allow()
+    assert breaker.allow()
+    assert breaker.acquire()
+    assert not breaker.allow()
+    assert not breaker.acquire()
+
+
+def test_released_probe_can_be_claimed_again():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.acquire()
+    breaker.release()
+    assert breaker.allow()
+    assert breaker.acquire()
+
+
+def test_probe_outcome_closes_or_reopens_the_breaker():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.acquire()
+    assert breaker.acquire()
+
+
+def test_retry_after_extends_the_open_period():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure(open_for=10)
+    time.sleep(0.06)
+    assert breaker.state == "open"
+    assert breaker.retry_in() > 9
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_backoff_honours_retry_after_up_to_the_max_delay():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=8)
+    assert policy.backoff(0, retry_after=2) == 2
+    assert policy.backoff(0, retry_after=30) is None
+    assert 0 <= policy.backoff(3) <= 4
+
+
+def test_retry_budget_is_a_share_of_first_attempts():
+    budget = RetryBudget(ratio=0.5, window=10, min_retries=1)
+    for _ in range(4):
+        budget.record_request()
+    granted = sum(budget.try_acquire() for _ in range(10))
+    assert granted == 3
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.microservices.common import scheduler
+from backend.microservices.common.scheduler import AdmissionRejected, Priority, TicketStream, UpstreamScheduler
+
+
+def _scheduler(max_concurrency: int = 1, user_rate: float = 100.0, user_burst: float = 100.0) -> UpstreamScheduler:
+    return UpstreamScheduler(max_concurrency, user_rate, user_burst)
+
+
+async def _admitted_order(upstream: UpstreamScheduler, requests: list[tuple[Priority, str]]) -> list[str]:
+    """Queue ``requests`` behind a held slot and return the order they are admitted in."""
+    order: list[str] = []
+    held = await upstream.admit(Priority.INTERACTIVE)
+
+    async def request(priority: Priority, name: str) -> None:
+        with await upstream.admit(priority, name.rstrip("0123456789")):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    tasks = []
+    for priority, name in requests:
+        tasks.append(asyncio.create_task(request(priority, name)))
+        await asyncio.sleep(0)
+    held.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_higher_priority_classes_are_admitted_first():
+    order = asyncio.run(
+        _admitted_order(
+            _scheduler(),
+            [(Priority.BACKGROUND, "batch1"), (Priority.INTERACTIVE, "chat1"), (Priority.INTERACTIVE_STREAM, "stream1")],
+        )
+    )
+    assert order == ["stream1", "chat1", "batch1"]
+
+
+def test_users_are_served_round_robin_within_a_class():
+    order = asyncio.run(
+        _admitted_order(
+            _scheduler(),
+            [(Priority.INTERACTIVE, name) for name in ("alice1", "alice2", "alice3", "bob1", "carol1")],
+        )
+    )
+    assert order == ["alice1", "bob1", "carol1", "alice2", "alice3"]
+
+
+def test_queued_call_is_shed_after_its_class_wait(monkeypatch):
+    monkeypatch.setitem(scheduler.MAX_WAIT_SECONDS, Priority.INTERACTIVE, 0.05)
+    upstream = _scheduler()
+
+    async def scenario() -> None:
+        held = await upstream.admit()
+        with pytest.raises(AdmissionRejected) as raised:
+            await upstream.admit(Priority.INTERACTIVE, "alice")
+        assert raised.value.status_code == 503
+        assert raised.value.headers["Retry-After"] == "1"
+        held.release()
+
+    asyncio.run(scenario())
+    snapshot = upstream.snapshot()
+    assert snapshot["active"] == 0
+    assert snapshot["classes"]["interactive"]["queueDepth"] == 0
+    assert snapshot["classes"]["interactive"]["rejected"] == 1
+
+
+def test_user_over_rate_limit_is_rejected_with_429():
+    upstream = _scheduler(max_concurrency=4, user_rate=0.01, user_burst=1)
+
+    async def scenario() -> None:
+        with await upstream.admit(Priority.INTERACTIVE, "alice"):
+            pass
+        with pytest.raises(AdmissionRejected) as raised:
+            await upstream.admit(Priority.INTERACTIVE, "alice")
+        assert raised.value.status_code == 429
+        # Other users keep their own bucket.
+        with await upstream.admit(Priority.INTERACTIVE, "bob"):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue_and_gets_its_token_back():
+    upstream = _scheduler(user_rate=0.001, user_burst=1)
+
+    async def scenario() -> None:
+        held = await upstream.admit()
+        waiting = asyncio.create_task(upstream.admit(Priority.INTERACTIVE, "alice"))
+        await asyncio.sleep(0.01)
+        assert upstream.snapshot()["classes"]["interactive"]["queueDepth"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert upstream.snapshot()["classes"]["interactive"]["queueDepth"] == 0
+        held.release()
+        # The refunded token admits alice right away.
+        with await upstream.admit(Priority.INTERACTIVE, "alice"):
+            pass
+
+    asyncio.run(scenario())
+    assert upstream.snapshot()["active"] == 0
+
+
+def test_cancelled_rate_limit_wait_refunds_the_token():
+    upstream = _scheduler(max_concurrency=4, user_rate=1.0, user_burst=1)
+
+    async def scenario() -> None:
+        with await upstream.admit(Priority.INTERACTIVE, "alice"):
+            pass
+        # The bucket is empty: this call sleeps about a second before queueing.
+        waiting = asyncio.create_task(upstream.admit(Priority.INTERACTIVE, "alice"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    bucket = upstream._buckets["alice"]
+    assert bucket.tokens > -0.5
+
+
+def test_run_keeps_the_slot_until_the_call_returns_even_if_the_caller_leaves():
+    upstream = _scheduler()
+    started = threading.Event()
+    finish = threading.Event()
+
+    def upstream_call() -> str:
+        started.set()
+        finish.wait(5)
+        return "advice"
+
+    async def scenario() -> None:
+        caller = asyncio.create_task(upstream.run(upstream_call))
+        await asyncio.to_thread(started.wait, 5)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        assert upstream.snapshot()["active"] == 1
+        finish.set()
+        for _ in range(100):
+            if upstream.snapshot()["active"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert upstream.snapshot()["active"] == 0
+        assert await upstream.run(lambda: "next") == "next"
+
+    asyncio.run(scenario())
+
+
+def test_admit_blocking_is_woken_by_a_release_from_another_thread():
+    upstream = _scheduler()
+
+    async def scenario() -> float:
+        held = await upstream.admit()
+        threading.Timer(0.05, held.release).start()
+        started = time.monotonic()
+        ticket = await asyncio.to_thread(upstream.admit_blocking, Priority.BACKGROUND, "refresh")
+        ticket.release()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.04
+    assert upstream.snapshot()["active"] == 0
+
+
+def test_ticket_stream_releases_when_exhausted_or_closed():
+    upstream = _scheduler(max_concurrency=2)
+    closed = []
+
+    def events():
+        try:
+            yield "data: 1\n\n"
+            yield "data: 2\n\n"
+        finally:
+            closed.append(True)
+
+    async def scenario() -> None:
+        stream = TicketStream(await upstream.admit(), events())
+        assert list(stream) == ["data: 1\n\n", "data: 2\n\n"]
+        stream.close()
+
+        # A client gone after the first event: the response closes the stream.
+        stream = TicketStream(await upstream.admit(), events())
+        assert next(stream) == "data: 1\n\n"
+        assert upstream.snapshot()["active"] == 1
+        stream.close()
+
+    asyncio.run(scenario())
+    assert closed == [True, True]
+    assert upstream.snapshot()["active"] == 0
@@ -0,0 +1,28 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.microservices.common import timing
+from backend.microservices.common.timing import SlowRequestLog
+
+
+def test_slow_request_log_keeps_the_slowest_requests():
+    log = SlowRequestLog(3)
+    for duration in (2500, 9000, 2100, 4000, 3000, 2200):
+        log.record({"route": "/r", "durationMs": duration})
+    assert [entry["durationMs"] for entry in log.entries()] == [9000, 4000, 3000]
+
+
+def test_slow_requests_endpoint_requires_the_debug_token(monkeypatch):
+    app = FastAPI()
+    app.include_router(timing.debug_router)
+    client = TestClient(app)
+
+    monkeypatch.setattr(timing, "DEBUG_TOKEN", None)
+    assert client.get("/debug/slow-requests", headers={"X-Debug-Token": ""}).status_code == 401
+
+    monkeypatch.setattr(timing, "DEBUG_TOKEN", "secret")
+    assert client.get("/debug/slow-requests").status_code == 401
+    assert client.get("/debug/slow-requests", headers={"X-Debug-Token": "wrong"}).status_code == 401
+    response = client.get("/debug/slow-requests", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["thresholdMs"] == timing.SLOW_REQUEST_THRESHOLD_MS
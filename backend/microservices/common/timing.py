@@ -0,0 +1,178 @@
+"""Per-request stage timing, ``Server-Timing`` headers and a slow-request log.
+
+:class:`ServerTimingMiddleware` attaches a :class:`RequestTimer` to every HTTP
+request through a context variable (which also follows ``run_in_threadpool``
+calls). Code wraps its stages in :func:`span`; the breakdown recorded before
+the response starts is sent as a ``Server-Timing`` header, and the slowest
+requests above ``SLOW_REQUEST_THRESHOLD_MS`` are kept, with all their spans,
+and served on ``GET /debug/slow-requests`` to callers presenting the
+``X-Debug-Token`` header.
+
+Environment variables:
+
+- ``SLOW_REQUEST_THRESHOLD_MS``: duration above which a request is logged (default 2000).
+- ``SLOW_REQUEST_LOG_SIZE``: number of slowest requests kept (default 100).
+- ``DEBUG_TOKEN``: token required by ``/debug/slow-requests``; without it the endpoint always answers 401.
+"""
+from __future__ import annotations
+
+import contextvars
+import heapq
+import hmac
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get("SLOW_REQUEST_THRESHOLD_MS", "2000"))
+SLOW_REQUEST_LOG_SIZE = int(os.environ.get("SLOW_REQUEST_LOG_SIZE", "100"))
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN")
+
+
+class RequestTimer:
+    """Spans recorded for one request, as ``(name, start offset, duration)`` in seconds."""
+
+    __slots__ = ("started", "spans")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float, float]] = []
+
+    def add(self, name: str, started: float, duration: float) -> None:
+        self.spans.append((name, started - self.started, duration))
+
+    def totals(self) -> dict[str, float]:
+        """Seconds per stage name; repeated or concurrent spans are summed."""
+        totals: dict[str, float] = {}
+        for name, _, duration in list(self.spans):
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def header(self, elapsed: float) -> str:
+        parts = [f"{name};dur={duration * 1000:.1f}" for name, duration in self.totals().items()]
+        parts.append(f"app;dur={elapsed * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_timer: contextvars.ContextVar[Optional[RequestTimer]] = contextvars.ContextVar(
+    "request_timer", default=None
+)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage ``name`` of the current request (no-op outside one)."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, started, time.perf_counter() - started)
+
+
+class SlowRequestLog:
+    """The ``size`` slowest requests seen, in a min-heap on their duration."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._heap: list[tuple[float, int, dict]] = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, entry: dict) -> None:
+        item = (entry["durationMs"], next(self._order), entry)
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif item[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def entries(self) -> list[dict]:
+        """Kept requests, slowest first."""
+        with self._lock:
+            items = sorted(self._heap, reverse=True)
+        return [entry for _, _, entry in items]
+
+
+slow_requests = SlowRequestLog(SLOW_REQUEST_LOG_SIZE)
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware adding ``Server-Timing`` and feeding the slow-request log."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        status = 500
+        first_byte: Optional[float] = None
+
+        async def send_wrapper(message) -> None:
+            nonlocal status, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                first_byte = time.perf_counter() - timer.started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.header(first_byte).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timer.reset(token)
+            elapsed = time.perf_counter() - timer.started
+            if elapsed * 1000 >= SLOW_REQUEST_THRESHOLD_MS:
+                route = getattr(scope.get("route"), "path", None) or scope.get("path", "")
+                slow_requests.record(
+                    {
+                        "at": datetime.now(timezone.utc).isoformat(),
+                        "method": scope.get("method", ""),
+                        "route": route,
+                        "path": scope.get("path", ""),
+                        "status": status,
+                        "durationMs": round(elapsed * 1000, 1),
+                        "firstByteMs": round(first_byte * 1000, 1) if first_byte is not None else None,
+                        "stagesMs": {name: round(value * 1000, 1) for name, value in timer.totals().items()},
+                        "spans": [
+                            {"name": name, "startMs": round(offset * 1000, 1), "durationMs": round(duration * 1000, 1)}
+                            for name, offset, duration in timer.spans
+                        ],
+                    }
+                )
+                print(f"[Timing] slow request {scope.get('method', '')} {route}: {elapsed * 1000:.0f} ms")
+
+
+def require_debug_token(x_debug_token: Optional[str] = Header(None)) -> None:
+    """Reject callers without the ``DEBUG_TOKEN``; request paths and timings are not public."""
+    if not DEBUG_TOKEN or not x_debug_token or not hmac.compare_digest(
+        x_debug_token.encode("utf-8"), DEBUG_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+
+debug_router = APIRouter(tags=["debug"], dependencies=[Depends(require_debug_token)])
+
+
+@debug_router.get("/debug/slow-requests")
+async def slow_requests_status(
+    limit: int = Query(20, ge=1, le=1000),
+    route: Optional[str] = Query(None, description="only requests to this route template"),
+) -> dict:
+    """Slowest requests above the threshold, with their stage breakdown."""
+    entries = [entry for entry in slow_requests.entries() if route is None or entry["route"] == route]
+    return {"thresholdMs": SLOW_REQUEST_THRESHOLD_MS, "requests": entries[:limit]}
@@ -2,17 +2,23 @@
 from __future__ import annotations
 
 import json
-import os
 from typing import List
 
-import requests
-from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+from backend.microservices.common.compression import CompressionMiddleware
+from backend.microservices.common.fastjson import FastJSONResponse, FastJSONRoute, dumps
+from backend.microservices.common.metrics import MetricsMiddleware, metrics_router, record_usage
+from backend.microservices.common.openrouter import chat_completion
+from backend.microservices.common.resilience import retry_after_headers
+from backend.microservices.common.scheduler import Priority, request_priority, status_router, upstream_scheduler
+from backend.microservices.common.timing import ServerTimingMiddleware, debug_router, span
+from backend.microservices.common.swr import StaleWhileRevalidateCache, freshness
 
-router = APIRouter(tags=["daily-analysis"])
+router = APIRouter(tags=["daily-analysis"], route_class=FastJSONRoute)
+advice_cache = StaleWhileRevalidateCache("analyze-daily")
 
 
 class Nutrition(BaseModel):
@@ -41,21 +47,20 @@ class DailyAnalysisRequest(BaseModel):
     meals: List[MealAnalysis]
 
 
-@router.post("/analyze-daily")
-async def analyze_daily(request: DailyAnalysisRequest) -> dict:
-    try:
-        total_calories = sum(meal.nutrition.calories for meal in request.meals)
-        total_proteins = sum(meal.nutrition.proteins for meal in request.meals)
-        total_carbs = sum(meal.nutrition.carbs for meal in request.meals)
-        total_fats = sum(meal.nutrition.fats for meal in request.meals)
-        total_fibers = sum(meal.nutrition.fibers for meal in request.meals)
-
-        meals_summary = "\n".join(
-            f"- {meal.mealType}: {meal.dishName} ({meal.nutrition.calories:.0f} kcal)"
-            for meal in request.meals
-        )
-        prompt = f"""You are a professional AI nutritionist.
-                     Analyze the following daily meals and provide a detailed nutritional summary in professional English.
+def _summarize_meals(request: DailyAnalysisRequest) -> tuple[dict, str]:
+    """Compute the local part of the daily summary and the LLM prompt."""
+    total_calories = sum(meal.nutrition.calories for meal in request.meals)
+    total_proteins = sum(meal.nutrition.proteins for meal in request.meals)
+    total_carbs = sum(meal.nutrition.carbs for meal in request.meals)
+    total_fats = sum(meal.nutrition.fats for meal in request.meals)
+    total_fibers = sum(meal.nutrition.fibers for meal in request.meals)
+
+    meals_summary = "\n".join(
+        f"- {meal.mealType}: {meal.dishName} ({meal.nutrition.calories:.0f} kcal)"
+        for meal in request.meals
+    )
+    prompt = f"""You are a professional AI nutritionist.
+                 Analyze the following daily meals and provide a detailed nutritional summary in professional English.
 **Daily Meals**:
 {meals_summary}
 
@@ -81,63 +86,175 @@ Return ONLY a strict JSON object:
     "needsMet": true/false
 }}
 """
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": "qwen/qwen2.5-vl-32b-instruct:free",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.2,
-            "response_format": {"type": "json_object"},
-        }
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data)
-        response.raise_for_status()
+    local_summary = {
+        "id": f"{request.userId}_{request.date}",
+        "userId": request.userId,
+        "date": request.date,
+        "mealAnalysisIds": [str(meal.timestamp) for meal in request.meals],
+        "totalNutrition": {
+            "calories": total_calories,
+            "proteins": total_proteins,
+            "carbs": total_carbs,
+            "fats": total_fats,
+            "fibers": total_fibers,
+        },
+    }
+    return local_summary, prompt
+
+
+def _request_daily_advice(prompt: str) -> dict:
+    """Ask OpenRouter for the LLM-generated fields of the daily summary."""
+    data = {
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+        "response_format": {"type": "json_object"},
+    }
+    response = chat_completion("daily", data)
+    if not response.ok:
+        print("[OpenRouter] analyze-daily error:", response.status_code, response.text)
+        raise HTTPException(
+            status_code=502,
+            detail="OpenRouter provider error. Please try again later.",
+            headers=retry_after_headers(response),
+        )
 
+    with span("parse"):
         result = response.json()
-        choices = result.get("choices")
-        if not choices:
-            print("[OpenRouter] analyze-daily unexpected payload:", result)
-            error_detail = result.get("error", {}).get("message") if isinstance(result, dict) else None
-            raise HTTPException(
-                status_code=502,
-                detail=error_detail or "Unexpected response from OpenRouter.",
-            )
-        message = choices[0].get("message") if isinstance(choices[0], dict) else None
-        content = (message or {}).get("content") if isinstance(message, dict) else None
-        if not content:
-            print("[OpenRouter] analyze-daily missing content:", result)
-            raise HTTPException(status_code=502, detail="Empty response from OpenRouter. Please retry later.")
+    record_usage("daily", result)
+    choices = result.get("choices")
+    if not choices:
+        print("[OpenRouter] analyze-daily unexpected payload:", result)
+        error_detail = result.get("error", {}).get("message") if isinstance(result, dict) else None
+        raise HTTPException(
+            status_code=502,
+            detail=error_detail or "Unexpected response from OpenRouter.",
+        )
+    message = choices[0].get("message") if isinstance(choices[0], dict) else None
+    content = (message or {}).get("content") if isinstance(message, dict) else None
+    if not content:
+        print("[OpenRouter] analyze-daily missing content:", result)
+        raise HTTPException(status_code=502, detail="Empty response from OpenRouter. Please retry later.")
 
+    with span("parse"):
         daily_analysis = json.loads(content)
-        needs_met = daily_analysis.get("needsMet", False)
-        if isinstance(needs_met, str):
-            needs_met = needs_met.strip().lower() in {"true", "oui", "yes", "1"}
-
-        summary = {
-            "id": f"{request.userId}_{request.date}",
-            "userId": request.userId,
-            "date": request.date,
-            "mealAnalysisIds": [str(meal.timestamp) for meal in request.meals],
-            "totalNutrition": {
-                "calories": total_calories,
-                "proteins": total_proteins,
-                "carbs": total_carbs,
-                "fats": total_fats,
-                "fibers": total_fibers,
-            },
-            "globalAdvice": daily_analysis.get("globalAdvice", ""),
-            "recommendations": daily_analysis.get("recommendations", ""),
-            "needsMet": bool(needs_met),
-        }
+    needs_met = daily_analysis.get("needsMet", False)
+    if isinstance(needs_met, str):
+        needs_met = needs_met.strip().lower() in {"true", "oui", "yes", "1"}
+
+    return {
+        "globalAdvice": daily_analysis.get("globalAdvice", ""),
+        "recommendations": daily_analysis.get("recommendations", ""),
+        "needsMet": bool(needs_met),
+    }
+
+
+async def _fetch_daily_advice(prompt: str, priority: Priority, user_id: str) -> dict:
+    """Wait for admission on the event loop, then call OpenRouter in the threadpool."""
+    return await upstream_scheduler.run(_request_daily_advice, prompt, priority=priority, user_id=user_id)
+
+
+def _refresh_daily_advice(prompt: str, user_id: str) -> dict:
+    """Background refresh for the SWR cache, run on its own refresh threads."""
+    with upstream_scheduler.admit_blocking(Priority.BACKGROUND, user_id):
+        return _request_daily_advice(prompt)
+
+
+def _sse_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {dumps(payload).decode('utf-8')}\n\n"
+
+
+@router.post("/analyze-daily")
+async def analyze_daily(
+    request: DailyAnalysisRequest,
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
+    staleWhileRevalidate: bool = Query(False),
+) -> dict:
+    """Summarize a day of meals.
+
+    With ``staleWhileRevalidate=true`` the last good advice for ``(userId, date)``
+    is returned immediately (totals are always recomputed) and refreshed in the
+    background; ``freshness`` tells how old the advice is.
+    """
+    try:
+        with span("summarize"):
+            summary, prompt = _summarize_meals(request)
+        key = (request.userId, request.date)
+        served = None
+        if staleWhileRevalidate:
+            served = advice_cache.serve(
+                key, lambda: _refresh_daily_advice(prompt, request.userId)
+            )
+        if served is not None:
+            advice, advice_freshness = served
+        else:
+            advice = await _fetch_daily_advice(prompt, priority, request.userId)
+            advice_cache.put(key, advice)
+            advice_freshness = freshness(0.0)
+        summary.update(advice)
+        if staleWhileRevalidate:
+            summary["freshness"] = advice_freshness
         return summary
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Daily analysis error: {exc}") from exc
 
 
+@router.post("/analyze-daily/stream")
+async def analyze_daily_stream(
+    request: DailyAnalysisRequest,
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
+) -> StreamingResponse:
+    """Two-tier variant of ``/analyze-daily``.
+
+    The locally computed totals are sent immediately as a ``stats`` event; the
+    LLM fields follow as an ``advice`` event (or ``error``).
+    """
+    try:
+        with span("summarize"):
+            summary, prompt = _summarize_meals(request)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Daily analysis error: {exc}") from exc
+
+    async def generate_events():
+        yield _sse_event("stats", summary)
+        try:
+            advice = await _fetch_daily_advice(prompt, priority, request.userId)
+            advice_cache.put((request.userId, request.date), advice)
+            yield _sse_event("advice", advice)
+        except HTTPException as exc:
+            yield _sse_event(
+                "error",
+                {
+                    "status": exc.status_code,
+                    "detail": exc.detail,
+                    "retryAfter": (exc.headers or {}).get("Retry-After"),
+                },
+            )
+        except Exception as exc:
+            yield _sse_event("error", {"status": 500, "detail": f"Daily analysis error: {exc}"})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="StressOFF Daily Analysis Service")
+    app = FastAPI(title="StressOFF Daily Analysis Service", default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.include_router(router)
+    app.include_router(status_router)
+    app.include_router(metrics_router)
+    app.include_router(debug_router)
 
     @app.get("/")
     async def root() -> dict[str, str]:
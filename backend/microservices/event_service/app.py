@@ -3,17 +3,20 @@ from __future__ import annotations
 
 from datetime import datetime
 import json
-import os
 from typing import Optional
 
-import requests
-from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException
 from pydantic import BaseModel
 
-OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+from backend.microservices.common.compression import CompressionMiddleware
+from backend.microservices.common.fastjson import FastJSONResponse, FastJSONRoute
+from backend.microservices.common.metrics import MetricsMiddleware, metrics_router, record_usage
+from backend.microservices.common.openrouter import chat_completion
+from backend.microservices.common.resilience import retry_after_headers
+from backend.microservices.common.scheduler import Priority, request_priority, status_router, upstream_scheduler
+from backend.microservices.common.timing import ServerTimingMiddleware, debug_router, span
 
-router = APIRouter(tags=["event-recommendation"])
+router = APIRouter(tags=["event-recommendation"], route_class=FastJSONRoute)
 
 
 class EventRequest(BaseModel):
@@ -31,7 +34,10 @@ class EventRecommendationResponse(BaseModel):
 
 
 @router.post("/generate-event-recommendation", response_model=EventRecommendationResponse)
-async def generate_event_recommendation(request: EventRequest) -> EventRecommendationResponse:
+async def generate_event_recommendation(
+    request: EventRequest,
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
+) -> EventRecommendationResponse:
     """Generate recommendations for a calendar event using OpenRouter."""
     event_title = request.eventTitle
     start_time = request.startTime
@@ -64,31 +70,33 @@ async def generate_event_recommendation(request: EventRequest) -> EventRecommend
     Be concise and professional.
     """
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
     payload = {
-        "model": "qwen/qwen2.5-vl-32b-instruct:free",
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.1,
         "response_format": {"type": "json_object"},
     }
 
-    response = requests.post(OPENROUTER_URL, headers=headers, json=payload)
+    response = await upstream_scheduler.run(chat_completion, "event", payload, priority=priority)
     if not response.ok:
         print("[OpenRouter] generate-event-recommendation error:", response.status_code, response.text)
-        raise HTTPException(status_code=502, detail="OpenRouter provider error")
+        raise HTTPException(
+            status_code=502,
+            detail="OpenRouter provider error",
+            headers=retry_after_headers(response),
+        )
 
     try:
-        result_json = response.json()
+        with span("parse"):
+            result_json = response.json()
+        record_usage("event", result_json)
         choices = result_json.get("choices", [])
         if not choices:
             raise HTTPException(status_code=502, detail="No choices returned by OpenRouter")
         content_str: Optional[str] = choices[0]["message"].get("content")
         if content_str is None:
             raise HTTPException(status_code=502, detail="Empty response from OpenRouter")
-        result = json.loads(content_str)
+        with span("parse"):
+            result = json.loads(content_str)
     except (ValueError, KeyError) as exc:
         print("[OpenRouter] JSON parse error:", exc)
         raise HTTPException(status_code=502, detail="Unexpected response from OpenRouter") from exc
@@ -103,8 +111,14 @@ async def generate_event_recommendation(request: EventRequest) -> EventRecommend
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="StressOFF Event Recommendation Service")
+    app = FastAPI(title="StressOFF Event Recommendation Service", default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.include_router(router)
+    app.include_router(status_router)
+    app.include_router(metrics_router)
+    app.include_router(debug_router)
 
     @app.get("/")
     async def root() -> dict[str, str]:
@@ -2,17 +2,23 @@
 from __future__ import annotations
 
 import json
-import os
 from typing import Dict, List, Optional
 
-import requests
-from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+from backend.microservices.common.compression import CompressionMiddleware
+from backend.microservices.common.fastjson import FastJSONResponse, FastJSONRoute, dumps
+from backend.microservices.common.metrics import MetricsMiddleware, metrics_router, record_usage
+from backend.microservices.common.openrouter import chat_completion
+from backend.microservices.common.resilience import retry_after_headers
+from backend.microservices.common.scheduler import Priority, request_priority, status_router, upstream_scheduler
+from backend.microservices.common.timing import ServerTimingMiddleware, debug_router, span
+from backend.microservices.common.swr import StaleWhileRevalidateCache, freshness
 
-router = APIRouter(tags=["health-analysis"])
+router = APIRouter(tags=["health-analysis"], route_class=FastJSONRoute)
+advice_cache = StaleWhileRevalidateCache("analyze-health")
 
 
 class HealthMetric(BaseModel):
@@ -52,78 +58,77 @@ def _coerce_text(value) -> str:
     return str(value)
 
 
-@router.post("/analyze-health")
-async def analyze_health(request: HealthAnalysisRequest) -> dict:
-    try:
-        if not request.metrics:
-            raise HTTPException(status_code=400, detail="No health metrics provided")
-
-        hrv_values = [m.hrv for m in request.metrics]
-        hr_values = [m.heartRate for m in request.metrics]
-        resting_hr_values = [m.restingHeartRate for m in request.metrics]
-        spo2_values = [m.spo2 for m in request.metrics if m.spo2 is not None]
-
-        median_hrv = sorted(hrv_values)[len(hrv_values) // 2]
-        avg_resting_hr = sum(resting_hr_values) / len(resting_hr_values)
-        avg_spo2 = sum(spo2_values) / len(spo2_values) if spo2_values else None
-
-        total_steps = sum(m.steps for m in request.metrics)
-        total_calories = sum(m.calories for m in request.metrics)
-        total_active_minutes = sum(m.activeMinutes for m in request.metrics)
-
-        hrv_variance = sum((x - median_hrv) ** 2 for x in hrv_values) / len(hrv_values)
-        stress_level = min(10, hrv_variance / 10)
-
-        alerts: List[str] = []
-        if len(hrv_values) > 1:
-            half = len(hrv_values) // 2
-            hrv_baseline = sum(hrv_values[:half]) / max(half, 1)
-            hrv_recent = sum(hrv_values[half:]) / max(len(hrv_values) - half, 1)
-            if hrv_baseline > 0 and (hrv_baseline - hrv_recent) / hrv_baseline > 0.20:
-                alerts.append("HRV dropped more than 20% - possible stress or overtraining")
-
-        if request.sleepData and request.sleepData.durationHours < 6:
-            alerts.append(f"Sleep duration low: {request.sleepData.durationHours:.1f}h (recommended: 7-9h)")
-
-        if avg_spo2 and avg_spo2 < 94:
-            alerts.append(f"Low blood oxygen: {avg_spo2:.1f}% (normal: >95%)")
-
-        sedentary_hours = (24 * 60 - total_active_minutes) / 60
-        if sedentary_hours > 22:
-            alerts.append("Very low activity detected - try to move more throughout the day")
-
-        profile = request.userProfile or {}
-        sleep_info = ""
-        if request.sleepData:
-            sleep_info = f"""
+def _summarize_metrics(request: HealthAnalysisRequest) -> tuple[List[str], dict, str]:
+    """Compute the local alerts, daily statistics and the LLM prompt for a request."""
+    if not request.metrics:
+        raise HTTPException(status_code=400, detail="No health metrics provided")
+
+    hrv_values = [m.hrv for m in request.metrics]
+    hr_values = [m.heartRate for m in request.metrics]
+    resting_hr_values = [m.restingHeartRate for m in request.metrics]
+    spo2_values = [m.spo2 for m in request.metrics if m.spo2 is not None]
+
+    median_hrv = sorted(hrv_values)[len(hrv_values) // 2]
+    avg_resting_hr = sum(resting_hr_values) / len(resting_hr_values)
+    avg_spo2 = sum(spo2_values) / len(spo2_values) if spo2_values else None
+
+    total_steps = sum(m.steps for m in request.metrics)
+    total_calories = sum(m.calories for m in request.metrics)
+    total_active_minutes = sum(m.activeMinutes for m in request.metrics)
+
+    hrv_variance = sum((x - median_hrv) ** 2 for x in hrv_values) / len(hrv_values)
+    stress_level = min(10, hrv_variance / 10)
+
+    alerts: List[str] = []
+    if len(hrv_values) > 1:
+        half = len(hrv_values) // 2
+        hrv_baseline = sum(hrv_values[:half]) / max(half, 1)
+        hrv_recent = sum(hrv_values[half:]) / max(len(hrv_values) - half, 1)
+        if hrv_baseline > 0 and (hrv_baseline - hrv_recent) / hrv_baseline > 0.20:
+            alerts.append("HRV dropped more than 20% - possible stress or overtraining")
+
+    if request.sleepData and request.sleepData.durationHours < 6:
+        alerts.append(f"Sleep duration low: {request.sleepData.durationHours:.1f}h (recommended: 7-9h)")
+
+    if avg_spo2 and avg_spo2 < 94:
+        alerts.append(f"Low blood oxygen: {avg_spo2:.1f}% (normal: >95%)")
+
+    sedentary_hours = (24 * 60 - total_active_minutes) / 60
+    if sedentary_hours > 22:
+        alerts.append("Very low activity detected - try to move more throughout the day")
+
+    profile = request.userProfile or {}
+    sleep_info = ""
+    if request.sleepData:
+        sleep_info = f"""
 Sleep last night:
 - Duration: {request.sleepData.durationHours:.1f}h
 - Quality score: {request.sleepData.qualityScore:.0f}/100
 - Deep sleep: {request.sleepData.deepSleepMinutes} min
 - REM sleep: {request.sleepData.remSleepMinutes} min
 """
-        sleep_quality_description = ""
-        if request.sleepData:
-            score = request.sleepData.qualityScore
-            duration = request.sleepData.durationHours
-            if score >= 85 and duration >= 7:
-                sleep_quality_description = "excellent and restful"
-            elif score >= 70:
-                sleep_quality_description = "good"
-            elif score >= 50:
-                if duration < 6:
-                    sleep_quality_description = "short and likely interrupted"
-                else:
-                    sleep_quality_description = "fair, possibly light"
+    sleep_quality_description = ""
+    if request.sleepData:
+        score = request.sleepData.qualityScore
+        duration = request.sleepData.durationHours
+        if score >= 85 and duration >= 7:
+            sleep_quality_description = "excellent and restful"
+        elif score >= 70:
+            sleep_quality_description = "good"
+        elif score >= 50:
+            if duration < 6:
+                sleep_quality_description = "short and likely interrupted"
+            else:
+                sleep_quality_description = "fair, possibly light"
+        else:
+            if duration < 5:
+                sleep_quality_description = "very poor and short"
             else:
-                if duration < 5:
-                    sleep_quality_description = "very poor and short"
-                else:
-                    sleep_quality_description = "poor and likely fitful"
+                sleep_quality_description = "poor and likely fitful"
 
-        alerts_text = "\n".join(f"- {alert}" for alert in alerts) if alerts else "No critical alerts"
+    alerts_text = "\n".join(f"- {alert}" for alert in alerts) if alerts else "No critical alerts"
 
-        prompt = f"""You are a health AI coach. Analyze this user's daily health data and provide brief, actionable advice.
+    prompt = f"""You are a health AI coach. Analyze this user's daily health data and provide brief, actionable advice.
 
 **User Profile:**
 - Gender: {profile.get('gender', 'Not specified')}
@@ -154,54 +159,112 @@ Provide a brief analysis in JSON format:
     "sleepPractices": "If sleep was poor or decent, provide 2-3 bullet-pointed tips to improve it. If sleep was excellent, provide a brief encouraging message about maintaining good habits. Use \\n for new lines."
 }}
 """
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": "qwen/qwen2.5-vl-32b-instruct:free",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "response_format": {"type": "json_object"},
-            "max_tokens": 400,
-        }
+    daily_stats = {
+        "avgRestingHR": round(avg_resting_hr, 1),
+        "medianHRV": round(median_hrv, 1),
+        "totalSteps": total_steps,
+        "totalCalories": round(total_calories, 1),
+        "totalActiveMinutes": total_active_minutes,
+        "avgSpO2": round(avg_spo2, 1) if avg_spo2 else None,
+        "stressLevel": round(stress_level, 1),
+    }
+    return alerts, daily_stats, prompt
+
+
+def _request_health_advice(prompt: str) -> dict:
+    """Ask OpenRouter for the LLM-generated fields of the health analysis."""
+    data = {
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"},
+        "max_tokens": 400,
+    }
+
+    response = chat_completion("health", data)
+    if not response.ok:
+        print("[OpenRouter] analyze-health error:", response.status_code, response.text)
+        raise HTTPException(
+            status_code=502,
+            detail="Health analysis service temporarily unavailable",
+            headers=retry_after_headers(response),
+        )
+
+    with span("parse"):
+        result = response.json()
+    record_usage("health", result)
+    choices = result.get("choices")
+    if not choices:
+        print("[OpenRouter] analyze-health unexpected payload:", result)
+        raise HTTPException(status_code=502, detail="Invalid response from health analysis service")
+
+    message = choices[0].get("message") if isinstance(choices[0], dict) else None
+    content = (message or {}).get("content") if isinstance(message, dict) else None
+    if not content:
+        raise HTTPException(status_code=502, detail="Empty response from health analysis service")
+
+    with span("parse"):
+        analysis = json.loads(content)
 
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data)
-        if not response.ok:
-            print("[OpenRouter] analyze-health error:", response.status_code, response.text)
-            raise HTTPException(status_code=502, detail="Health analysis service temporarily unavailable")
+    return {
+        "summary": _coerce_text(analysis.get("summary")),
+        "action": _coerce_text(analysis.get("action")),
+        "breakfastSuggestion": _coerce_text(analysis.get("breakfastSuggestion")),
+        "indicatorToWatch": _coerce_text(analysis.get("indicatorToWatch")),
+        "sleepRemark": _coerce_text(analysis.get("sleepRemark")),
+        "sleepPractices": _coerce_text(analysis.get("sleepPractices")),
+    }
 
-        result = response.json()
-        choices = result.get("choices")
-        if not choices:
-            print("[OpenRouter] analyze-health unexpected payload:", result)
-            raise HTTPException(status_code=502, detail="Invalid response from health analysis service")
 
-        message = choices[0].get("message") if isinstance(choices[0], dict) else None
-        content = (message or {}).get("content") if isinstance(message, dict) else None
-        if not content:
-            raise HTTPException(status_code=502, detail="Empty response from health analysis service")
+async def _fetch_health_advice(prompt: str, priority: Priority, user_id: str) -> dict:
+    """Wait for admission on the event loop, then call OpenRouter in the threadpool."""
+    return await upstream_scheduler.run(_request_health_advice, prompt, priority=priority, user_id=user_id)
 
-        analysis = json.loads(content)
 
-        return {
-            "summary": _coerce_text(analysis.get("summary")),
-            "action": _coerce_text(analysis.get("action")),
-            "breakfastSuggestion": _coerce_text(analysis.get("breakfastSuggestion")),
-            "indicatorToWatch": _coerce_text(analysis.get("indicatorToWatch")),
-            "sleepRemark": _coerce_text(analysis.get("sleepRemark")),
-            "sleepPractices": _coerce_text(analysis.get("sleepPractices")),
+def _refresh_health_advice(prompt: str, user_id: str) -> dict:
+    """Background refresh for the SWR cache, run on its own refresh threads."""
+    with upstream_scheduler.admit_blocking(Priority.BACKGROUND, user_id):
+        return _request_health_advice(prompt)
+
+
+def _sse_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {dumps(payload).decode('utf-8')}\n\n"
+
+
+@router.post("/analyze-health")
+async def analyze_health(
+    request: HealthAnalysisRequest,
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
+    staleWhileRevalidate: bool = Query(False),
+) -> dict:
+    """Analyze a day of health metrics.
+
+    With ``staleWhileRevalidate=true`` the last good advice for ``(userId, date)``
+    is returned immediately (stats are always recomputed) and refreshed in the
+    background; ``freshness`` tells how old the advice is.
+    """
+    try:
+        with span("summarize"):
+            alerts, daily_stats, prompt = _summarize_metrics(request)
+        key = (request.userId, request.date)
+        served = None
+        if staleWhileRevalidate:
+            served = advice_cache.serve(
+                key, lambda: _refresh_health_advice(prompt, request.userId)
+            )
+        if served is not None:
+            advice, advice_freshness = served
+        else:
+            advice = await _fetch_health_advice(prompt, priority, request.userId)
+            advice_cache.put(key, advice)
+            advice_freshness = freshness(0.0)
+        result = {
+            **advice,
             "alerts": alerts,
-            "dailyStats": {
-                "avgRestingHR": round(avg_resting_hr, 1),
-                "medianHRV": round(median_hrv, 1),
-                "totalSteps": total_steps,
-                "totalCalories": round(total_calories, 1),
-                "totalActiveMinutes": total_active_minutes,
-                "avgSpO2": round(avg_spo2, 1) if avg_spo2 else None,
-                "stressLevel": round(stress_level, 1),
-            },
+            "dailyStats": daily_stats,
         }
+        if staleWhileRevalidate:
+            result["freshness"] = advice_freshness
+        return result
     except HTTPException:
         raise
     except Exception as exc:
@@ -209,9 +272,65 @@ Provide a brief analysis in JSON format:
         raise HTTPException(status_code=500, detail=f"Health analysis failed: {exc}") from exc
 
 
+@router.post("/analyze-health/stream")
+async def analyze_health_stream(
+    request: HealthAnalysisRequest,
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
+) -> StreamingResponse:
+    """Two-tier variant of ``/analyze-health``.
+
+    The locally computed ``alerts`` and ``dailyStats`` are sent immediately as a
+    ``stats`` event; the LLM fields follow as an ``advice`` event (or ``error``).
+    """
+    try:
+        with span("summarize"):
+            alerts, daily_stats, prompt = _summarize_metrics(request)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        print(f"[HealthService] Health analysis error: {exc}")
+        raise HTTPException(status_code=500, detail=f"Health analysis failed: {exc}") from exc
+
+    async def generate_events():
+        yield _sse_event("stats", {"alerts": alerts, "dailyStats": daily_stats})
+        try:
+            advice = await _fetch_health_advice(prompt, priority, request.userId)
+            advice_cache.put((request.userId, request.date), advice)
+            yield _sse_event("advice", advice)
+        except HTTPException as exc:
+            yield _sse_event(
+                "error",
+                {
+                    "status": exc.status_code,
+                    "detail": exc.detail,
+                    "retryAfter": (exc.headers or {}).get("Retry-After"),
+                },
+            )
+        except Exception as exc:
+            print(f"[HealthService] Health advice error: {exc}")
+            yield _sse_event("error", {"status": 500, "detail": f"Health analysis failed: {exc}"})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="StressOFF Health Analysis Service")
+    app = FastAPI(title="StressOFF Health Analysis Service", default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.include_router(router)
+    app.include_router(status_router)
+    app.include_router(metrics_router)
+    app.include_router(debug_router)
 
     @app.get("/")
     async def root() -> dict[str, str]:
@@ -1,6 +1,7 @@
 """Meal analysis microservice for StressOFF."""
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
 import os
@@ -8,14 +9,31 @@ from io import BytesIO
 from typing import Optional
 
 import requests
-from fastapi import APIRouter, FastAPI, File, Form, HTTPException, UploadFile
-from pydantic import BaseModel
-from PIL import Image
+from fastapi import APIRouter, Depends, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.background import BackgroundTask
 
-OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
-OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+from backend.microservices.common.compression import CompressionMiddleware
+from backend.microservices.common.fastjson import FastJSONResponse, FastJSONRoute, dumps, loads
+from backend.microservices.common.metrics import MetricsMiddleware, image_bytes, metrics_router, record_usage
+from backend.microservices.common.openrouter import chat_completion
+from backend.microservices.common.resilience import retry_after_headers
+from backend.microservices.common.scheduler import (
+    Priority,
+    TicketStream,
+    request_priority,
+    status_router,
+    upstream_scheduler,
+)
+from backend.microservices.common.timing import ServerTimingMiddleware, debug_router, span
 
-router = APIRouter(tags=["meal-analysis"])
+MEAL_BATCH_MAX_IMAGES = int(os.environ.get("MEAL_BATCH_MAX_IMAGES", "4"))  # images per upstream request
+MEAL_BATCH_MAX_UPLOADS = int(os.environ.get("MEAL_BATCH_MAX_UPLOADS", "12"))  # images per batch request
+
+router = APIRouter(tags=["meal-analysis"], route_class=FastJSONRoute)
 
 
 class Nutrition(BaseModel):
@@ -35,9 +53,24 @@ class MealAnalysis(BaseModel):
     allergiesDetected: list[str] = []
 
 
+class BatchMealItem(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    mealType: Optional[str] = None
+    analysis: Optional[MealAnalysis] = None
+    error: Optional[str] = None
+
+
+class BatchMealAnalysis(BaseModel):
+    results: list[BatchMealItem]
+
+
 def compress_image(image_bytes: bytes, max_side: int = 800, quality: int = 75) -> bytes:
     """Downscale and compress user-provided images."""
     try:
+        # Pillow (and the numpy it may pull in) is only loaded on the first image.
+        from PIL import Image
+
         with Image.open(BytesIO(image_bytes)) as img:
             if img.mode != "RGB":
                 img = img.convert("RGB")
@@ -51,8 +84,19 @@ def compress_image(image_bytes: bytes, max_side: int = 800, quality: int = 75) -
     return image_bytes
 
 
-def create_meal_prompt(user_profile: dict, meal_type: Optional[str] = None, user_allergies: Optional[list[str]] = None) -> str:
-    """Create the LLM prompt for meal analysis."""
+MEAL_TASK = """
+**Task**:
+1. Identify the dish name in English (exact Tunisian name if applicable, otherwise a description, all in english)
+2. List main ingredients
+3. Estimate macronutrients (typical portions)
+4. Provide personalized health advice based on user profile
+5. Suggest possible improvements or adjustments
+6. Detect if any of the user's known allergies are present. If yes, list them clearly in `allergiesDetected`.
+"""
+
+
+def _meal_profile_context(user_profile: dict, user_allergies: Optional[list[str]] = None) -> str:
+    """Role and user profile shared by the single and batch meal prompts."""
     context = f"""You are a professional AI dietitian specialized in Mediterranean, Tunisian, and French cuisine.
                   Analyze the provided meal image and respond strictly in professional English with clear, accurate, and coherent output.
 
@@ -64,6 +108,12 @@ def create_meal_prompt(user_profile: dict, meal_type: Optional[str] = None, user
 """
     if user_allergies:
         context += f"- Known allergies: {', '.join(user_allergies)}\n"
+    return context
+
+
+def create_meal_prompt(user_profile: dict, meal_type: Optional[str] = None, user_allergies: Optional[list[str]] = None) -> str:
+    """Create the LLM prompt for meal analysis."""
+    context = _meal_profile_context(user_profile, user_allergies)
     if meal_type:
         meal_types = {
             "breakfast": "Breakfast",
@@ -72,15 +122,8 @@ def create_meal_prompt(user_profile: dict, meal_type: Optional[str] = None, user
             "snack": "Snack",
         }
         context += f"- Meal type: {meal_types.get(meal_type, meal_type)}\n"
+    context += MEAL_TASK
     context += """
-**Task**:
-1. Identify the dish name in English (exact Tunisian name if applicable, otherwise a description, all in english)
-2. List main ingredients
-3. Estimate macronutrients (typical portions)
-4. Provide personalized health advice based on user profile
-5. Suggest possible improvements or adjustments
-6. Detect if any of the user's known allergies are present. If yes, list them clearly in `allergiesDetected`.
-
 **IMPORTANT**: Return ONLY a strict JSON object without extra text:
 
 {
@@ -101,89 +144,459 @@ def create_meal_prompt(user_profile: dict, meal_type: Optional[str] = None, user
     return context
 
 
+def create_batch_meal_prompt(user_profile: dict, meal_types: list[Optional[str]], user_allergies: Optional[list[str]] = None) -> str:
+    """Create the LLM prompt for analyzing several meal images in one request."""
+    context = _meal_profile_context(user_profile, user_allergies) + MEAL_TASK + "\n"
+    image_lines = "\n".join(
+        f"- Image {position}: {meal_type or 'Unspecified meal type'}"
+        for position, meal_type in enumerate(meal_types, start=1)
+    )
+    context += f"""
+**Images**: you receive {len(meal_types)} meal images, in this order:
+{image_lines}
+
+Analyze each image independently.
+
+**IMPORTANT**: Return ONLY a strict JSON object without extra text, with exactly {len(meal_types)} entries in `meals`, in the same order as the images:
+
+{{
+    "meals": [
+        {{
+            "dishName": "Dish name",
+            "ingredients": ["ingredient1", "ingredient2", ...],
+            "nutrition": {{
+                "calories": 0,
+                "proteins": 0,
+                "carbs": 0,
+                "fats": 0,
+                "fibers": 0
+            }},
+            "healthAdvice": "Personalized health advice",
+            "recommendation": "Suggested adjustments",
+            "allergiesDetected": ["allergen1", "allergen2"]
+        }}
+    ]
+}}
+"""
+    return context
+
+
+class _IncrementalJsonObject:
+    """Incrementally scan a streamed JSON object and report its top-level fields.
+
+    Text is fed chunk by chunk; every top-level ``"key": value`` pair is returned
+    as soon as the delimiter that closes it (``,`` or the final ``}``) arrives.
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+        self.fields: dict = {}
+        self.complete = False
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        self._text += chunk
+        text = self._text
+        completed: list[tuple[str, object]] = []
+        for index in range(self._pos, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if self.complete:
+                break
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._member_start is None:
+                    self._member_start = index
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._close_member(index, completed)
+                    self.complete = True
+                self._depth = max(self._depth - 1, 0)
+            elif char == "," and self._depth == 1:
+                self._close_member(index, completed)
+        self._pos = len(text)
+        return completed
+
+    def _close_member(self, end: int, completed: list[tuple[str, object]]) -> None:
+        if self._member_start is None:
+            return
+        member = self._text[self._member_start:end].strip()
+        self._member_start = None
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            return
+        for key, value in parsed.items():
+            self.fields[key] = value
+            completed.append((key, value))
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+
+def _sse_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {dumps(payload).decode('utf-8')}\n\n"
+
+
+def _compress_and_log(image_data: bytes) -> bytes:
+    with span("compress"):
+        compressed_image_data = compress_image(image_data)
+    image_bytes.observe(len(image_data), stage="original")
+    image_bytes.observe(len(compressed_image_data), stage="compressed")
+    if len(compressed_image_data) != len(image_data):
+        print(
+            f"[MealService] image compressed from {len(image_data)} to {len(compressed_image_data)} bytes"
+        )
+    return compressed_image_data
+
+
+def _image_content(image_data: bytes) -> dict:
+    with span("encode"):
+        image_base64 = base64.b64encode(image_data).decode("utf-8")
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
+    }
+
+
+def _build_meal_messages(
+    image_data: bytes,
+    meal_type: Optional[str],
+    user_profile: Optional[str],
+) -> list[dict]:
+    """Compress the image and build the multimodal chat messages for the meal prompt.
+
+    Pillow decoding and resizing are CPU-bound, so handlers run this in the threadpool.
+    """
+    compressed_image_data = _compress_and_log(image_data)
+
+    with span("prompt"):
+        profile = json.loads(user_profile) if user_profile else {}
+        user_allergies = profile.get("allergies", [])
+        prompt_text = create_meal_prompt(profile, meal_type, user_allergies)
+
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt_text},
+                _image_content(compressed_image_data),
+            ],
+        }
+    ]
+
+
+def _request_meal_analysis(messages: list[dict]) -> dict:
+    """Send the meal messages to the vision model and decode its JSON answer.
+
+    Callers run it through :data:`upstream_scheduler`, which holds the ticket.
+    """
+    data = {
+        "messages": messages,
+        "temperature": 0.1,
+        "response_format": {"type": "json_object"},
+    }
+    response = chat_completion("meal", data)
+    if not response.ok:
+        print("[OpenRouter] analyze-meal error:", response.status_code, response.text)
+        if response.status_code == 429:
+            raise HTTPException(
+                status_code=429,
+                detail=(
+                    "The analysis service is temporarily overloaded. "
+                    "Please try again in a minute or use your own OpenRouter key."
+                ),
+                headers=retry_after_headers(response),
+            )
+        raise HTTPException(
+            status_code=502,
+            detail="OpenRouter provider error. Please try again later.",
+            headers=retry_after_headers(response),
+        )
+
+    with span("parse"):
+        result = response.json()
+    record_usage("meal", result)
+    choices = result.get("choices")
+    if not choices:
+        print("[OpenRouter] analyze-meal unexpected payload:", result)
+        error_detail = result.get("error", {}).get("message") if isinstance(result, dict) else None
+        raise HTTPException(
+            status_code=502,
+            detail=error_detail or "Unexpected response from OpenRouter.",
+        )
+    message = choices[0].get("message") if isinstance(choices[0], dict) else None
+    analysis_text = (message or {}).get("content") if isinstance(message, dict) else None
+    if not analysis_text:
+        print("[OpenRouter] analyze-meal missing content:", result)
+        raise HTTPException(status_code=502, detail="Empty response from OpenRouter. Please retry later.")
+    with span("parse"):
+        return json.loads(analysis_text)
+
+
 @router.post("/analyze-meal", response_model=MealAnalysis)
 async def analyze_meal(
     image: UploadFile = File(...),
-    userId: str = Form(...),  # noqa: ARG001  - kept for compatibility with clients
+    userId: str = Form(...),
     mealType: Optional[str] = Form(None),
     userProfile: Optional[str] = Form(None),
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
 ) -> dict:
     try:
         image_data = await image.read()
-        compressed_image_data = compress_image(image_data)
-        if len(compressed_image_data) != len(image_data):
-            print(
-                f"[MealService] image compressed from {len(image_data)} to {len(compressed_image_data)} bytes"
-            )
-        image_base64 = base64.b64encode(compressed_image_data).decode("utf-8")
+        messages = await run_in_threadpool(_build_meal_messages, image_data, mealType, userProfile)
+        return await upstream_scheduler.run(_request_meal_analysis, messages, priority=priority, user_id=userId)
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=500, detail=f"JSON decoding error: {exc}") from exc
+    except HTTPException:
+        raise
+    except Exception as exc:  # pragma: no cover - defensive
+        print("[MealService] analyze-meal exception:", str(exc))
+        raise HTTPException(status_code=500, detail=f"Analysis error: {exc}") from exc
 
-        profile = json.loads(userProfile) if userProfile else {}
-        user_allergies = profile.get("allergies", [])
-        prompt_text = create_meal_prompt(profile, mealType, user_allergies)
 
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt_text},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
-                    },
-                ],
-            }
-        ]
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": "qwen/qwen2.5-vl-32b-instruct:free",
-            "messages": messages,
-            "temperature": 0.1,
-            "response_format": {"type": "json_object"},
-        }
-        response = requests.post(OPENROUTER_URL, headers=headers, json=data)
-        if not response.ok:
-            print("[OpenRouter] analyze-meal error:", response.status_code, response.text)
-            if response.status_code == 429:
-                raise HTTPException(
-                    status_code=429,
-                    detail=(
-                        "The analysis service is temporarily overloaded. "
-                        "Please try again in a minute or use your own OpenRouter key."
-                    ),
-                )
-            raise HTTPException(status_code=502, detail="OpenRouter provider error. Please try again later.")
+@router.post("/analyze-meal/stream")
+async def analyze_meal_stream(
+    image: UploadFile = File(...),
+    userId: str = Form(...),
+    mealType: Optional[str] = Form(None),
+    userProfile: Optional[str] = Form(None),
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE_STREAM)),
+) -> StreamingResponse:
+    """Streaming variant of ``/analyze-meal``.
 
-        result = response.json()
-        choices = result.get("choices")
-        if not choices:
-            print("[OpenRouter] analyze-meal unexpected payload:", result)
-            error_detail = result.get("error", {}).get("message") if isinstance(result, dict) else None
-            raise HTTPException(
-                status_code=502,
-                detail=error_detail or "Unexpected response from OpenRouter.",
-            )
-        message = choices[0].get("message") if isinstance(choices[0], dict) else None
-        analysis_text = (message or {}).get("content") if isinstance(message, dict) else None
-        if not analysis_text:
-            print("[OpenRouter] analyze-meal missing content:", result)
-            raise HTTPException(status_code=502, detail="Empty response from OpenRouter. Please retry later.")
-        analysis_json = json.loads(analysis_text)
-        return analysis_json
+    Each top-level field of the analysis (``dishName``, ``ingredients``,
+    ``nutrition``...) is sent as a ``field`` event as soon as it is complete,
+    followed by the validated ``result`` event (or ``error``).
+    """
+    try:
+        image_data = await image.read()
+        messages = await run_in_threadpool(_build_meal_messages, image_data, mealType, userProfile)
     except json.JSONDecodeError as exc:
         raise HTTPException(status_code=500, detail=f"JSON decoding error: {exc}") from exc
-    except HTTPException:
-        raise
     except Exception as exc:  # pragma: no cover - defensive
         print("[MealService] analyze-meal exception:", str(exc))
         raise HTTPException(status_code=500, detail=f"Analysis error: {exc}") from exc
 
+    data = {
+        "messages": messages,
+        "temperature": 0.1,
+        "response_format": {"type": "json_object"},
+        "stream": True,
+        "usage": {"include": True},
+    }
+    ticket = await upstream_scheduler.admit(priority, userId)
+
+    def generate_events():
+        parser = _IncrementalJsonObject()
+        try:
+            with chat_completion("meal", data, stream=True, timeout=60) as response:
+                if not response.ok:
+                    print("[OpenRouter] analyze-meal error:", response.status_code, response.text)
+                    yield _sse_event(
+                        "error",
+                        {
+                            "status": response.status_code,
+                            "detail": "OpenRouter provider error",
+                            "retryAfter": response.headers.get("Retry-After"),
+                        },
+                    )
+                    yield "data: [DONE]\n\n"
+                    return
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    decoded = line.decode("utf-8")
+                    if not decoded.startswith("data: "):
+                        continue
+                    data_str = decoded[6:]
+                    if data_str.strip() == "[DONE]":
+                        break
+                    try:
+                        chunk = loads(data_str)
+                    except json.JSONDecodeError:
+                        continue
+                    record_usage("meal", chunk)
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if not content:
+                        continue
+                    for name, value in parser.feed(content):
+                        yield _sse_event("field", {"name": name, "value": value})
+
+            analysis = parser.fields
+            if not parser.complete:
+                # Providers that ignore streaming for JSON mode may send a single
+                # blob the scanner could not split; fall back to a full parse.
+                try:
+                    analysis = {**json.loads(parser.text), **analysis}
+                except json.JSONDecodeError:
+                    pass
+            result = MealAnalysis(**analysis)
+            yield _sse_event("result", jsonable_encoder(result))
+        except ValidationError as exc:
+            print("[MealService] analyze-meal invalid analysis:", exc)
+            yield _sse_event("error", {"status": 502, "detail": "Incomplete analysis from OpenRouter. Please retry later."})
+        except Exception as exc:
+            print("[MealService] analyze-meal stream exception:", str(exc))
+            yield _sse_event("error", {"status": 500, "detail": f"Analysis error: {exc}"})
+        yield "data: [DONE]\n\n"
+
+    stream = TicketStream(ticket, generate_events())
+    try:
+        # Closing the stream after the response also covers a body that was
+        # never iterated (client gone before the first chunk).
+        return StreamingResponse(
+            stream,
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+            },
+            background=BackgroundTask(stream.close),
+        )
+    except BaseException:
+        stream.close()
+        raise
+
+
+def _analyze_meal_group(
+    positions: list[int],
+    images: list[bytes],
+    meal_types: list[Optional[str]],
+    profile: dict,
+) -> dict[int, tuple[Optional[MealAnalysis], Optional[str]]]:
+    """Analyze a group of images with a single upstream request.
+
+    Returns ``{position: (analysis, error)}``; an invalid entry only fails its
+    own image, an upstream failure fails the whole group.
+    """
+    group_types = [meal_types[position] for position in positions]
+    with span("prompt"):
+        prompt_text = create_batch_meal_prompt(profile, group_types, profile.get("allergies", []))
+    content: list[dict] = [{"type": "text", "text": prompt_text}]
+    for number, position in enumerate(positions, start=1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append(_image_content(images[position]))
+
+    try:
+        payload = _request_meal_analysis([{"role": "user", "content": content}])
+    except HTTPException as exc:
+        return {position: (None, str(exc.detail)) for position in positions}
+    except json.JSONDecodeError as exc:
+        return {position: (None, f"JSON decoding error: {exc}") for position in positions}
+    except requests.RequestException as exc:
+        print("[MealService] analyze-meal batch upstream error:", str(exc))
+        return {position: (None, "OpenRouter is unreachable. Please try again later.") for position in positions}
+
+    entries = payload.get("meals") if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        # A single-image group may come back in the plain MealAnalysis shape.
+        entries = [payload] if len(positions) == 1 else []
+
+    outcome: dict[int, tuple[Optional[MealAnalysis], Optional[str]]] = {}
+    for number, position in enumerate(positions):
+        if number >= len(entries) or not isinstance(entries[number], dict):
+            outcome[position] = (None, "No analysis returned for this image.")
+            continue
+        try:
+            outcome[position] = (MealAnalysis(**entries[number]), None)
+        except ValidationError as exc:
+            print("[MealService] analyze-meal batch invalid entry:", exc)
+            outcome[position] = (None, "Invalid analysis returned for this image.")
+    return outcome
+
+
+@router.post("/analyze-meal/batch", response_model=BatchMealAnalysis)
+async def analyze_meal_batch(
+    images: list[UploadFile] = File(...),
+    userId: str = Form(...),
+    mealTypes: Optional[list[str]] = Form(None),
+    userProfile: Optional[str] = Form(None),
+    priority: Priority = Depends(request_priority(Priority.INTERACTIVE)),
+) -> dict:
+    """Analyze several meal images, packing them into as few vision requests as possible.
+
+    ``mealTypes`` is repeated once per image, in the same order as ``images``.
+    Every image gets its own entry in ``results``, with either an ``analysis``
+    or an ``error``. At most ``MEAL_BATCH_MAX_UPLOADS`` images are accepted,
+    and their groups are sent upstream one after another, so one batch never
+    holds more than one upstream slot or drains the user's rate limit at once.
+    """
+    if len(images) > MEAL_BATCH_MAX_UPLOADS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many images: a batch accepts at most {MEAL_BATCH_MAX_UPLOADS}.",
+        )
+    try:
+        profile = json.loads(userProfile) if userProfile else {}
+    except json.JSONDecodeError as exc:
+        raise HTTPException(status_code=500, detail=f"JSON decoding error: {exc}") from exc
+
+    meal_types: list[Optional[str]] = list(mealTypes or [])
+    meal_types += [None] * (len(images) - len(meal_types))
+
+    raw_images = [await image.read() for image in images]
+    compressed = await asyncio.gather(
+        *(run_in_threadpool(_compress_and_log, image_data) for image_data in raw_images)
+    )
+
+    group_size = max(MEAL_BATCH_MAX_IMAGES, 1)
+    positions = list(range(len(images)))
+    groups = [positions[start:start + group_size] for start in range(0, len(positions), group_size)]
+
+    async def analyze_group(group: list[int]) -> dict[int, tuple[Optional[MealAnalysis], Optional[str]]]:
+        try:
+            return await upstream_scheduler.run(
+                _analyze_meal_group, group, list(compressed), meal_types, profile, priority=priority, user_id=userId
+            )
+        except HTTPException as exc:
+            return {position: (None, str(exc.detail)) for position in group}
+
+    merged: dict[int, tuple[Optional[MealAnalysis], Optional[str]]] = {}
+    for group in groups:
+        merged.update(await analyze_group(group))
+    return {
+        "results": [
+            {
+                "index": position,
+                "filename": images[position].filename,
+                "mealType": meal_types[position],
+                "analysis": merged[position][0],
+                "error": merged[position][1],
+            }
+            for position in positions
+        ]
+    }
+
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="StressOFF Meal Analysis Service")
+    app = FastAPI(title="StressOFF Meal Analysis Service", default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.include_router(router)
+    app.include_router(status_router)
+    app.include_router(metrics_router)
+    app.include_router(debug_router)
 
     @app.get("/")
     async def root() -> dict[str, str]:
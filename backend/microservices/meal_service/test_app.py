@@ -0,0 +1,117 @@
+import io
+import json
+import time
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from backend.microservices.meal_service import app as meal_app
+from backend.microservices.meal_service.app import _IncrementalJsonObject
+
+ANALYSIS = {
+    "dishName": "Chicken salad, with \"ranch\" {dressing}",
+    "ingredients": ["chicken", "lettuce", "tomato"],
+    "nutrition": {"calories": 420, "protein": 35.5, "notes": [1, {"a": "]"}]},
+    "healthScore": 7,
+    "allergens": [],
+}
+
+
+def _feed_all(text: str, size: int) -> tuple[_IncrementalJsonObject, list[tuple[str, object]]]:
+    parser = _IncrementalJsonObject()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+@pytest.mark.parametrize("size", [1, 3, 17, 10_000])
+def test_fields_are_reported_once_in_order_whatever_the_chunking(size):
+    text = json.dumps(ANALYSIS, indent=2)
+    parser, events = _feed_all(text, size)
+    assert events == list(ANALYSIS.items())
+    assert parser.fields == ANALYSIS
+    assert parser.complete
+    assert parser.text == text
+
+
+def test_field_is_only_reported_once_its_delimiter_arrives():
+    parser = _IncrementalJsonObject()
+    assert parser.feed('{"dishName": "Soup", "healthScore": 8') == [("dishName", "Soup")]
+    assert parser.feed("") == []
+    assert parser.feed("}") == [("healthScore", 8)]
+    assert parser.complete
+
+
+def test_text_after_the_object_is_ignored():
+    parser = _IncrementalJsonObject()
+    events = parser.feed('{"dishName": "Soup"} {"dishName": "Other"}')
+    assert events == [("dishName", "Soup")]
+    assert parser.fields == {"dishName": "Soup"}
+
+
+def test_truncated_stream_is_not_complete():
+    parser, events = _feed_all('{"dishName": "Soup", "ingredients": ["leek", "pot', 5)
+    assert events == [("dishName", "Soup")]
+    assert not parser.complete
+
+
+def _jpeg() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 120, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _post_batch(client: TestClient, count: int, user_id: str):
+    image = _jpeg()
+    return client.post(
+        "/analyze-meal/batch",
+        data={"userId": user_id},
+        files=[("images", (f"meal{index}.jpg", image, "image/jpeg")) for index in range(count)],
+    )
+
+
+def test_batch_over_the_upload_limit_is_rejected_before_any_upstream_call(monkeypatch):
+    monkeypatch.setattr(meal_app, "MEAL_BATCH_MAX_UPLOADS", 3)
+    monkeypatch.setattr(meal_app, "_analyze_meal_group", pytest.fail)
+    response = _post_batch(TestClient(meal_app.app), 4, "batch-limit")
+    assert response.status_code == 413
+
+
+def test_batch_groups_are_sent_one_after_another(monkeypatch):
+    monkeypatch.setattr(meal_app, "MEAL_BATCH_MAX_IMAGES", 2)
+    running = []
+    overlap = []
+    groups = []
+
+    def analyze_group(positions, images, meal_types, profile):
+        running.append(positions)
+        overlap.append(len(running))
+        time.sleep(0.05)
+        running.remove(positions)
+        groups.append(positions)
+        return {position: (None, f"group {positions[0]}") for position in positions}
+
+    monkeypatch.setattr(meal_app, "_analyze_meal_group", analyze_group)
+    response = _post_batch(TestClient(meal_app.app), 5, "batch-sequential")
+    assert response.status_code == 200
+    assert groups == [[0, 1], [2, 3], [4]]
+    assert max(overlap) == 1
+    assert [result["error"] for result in response.json()["results"]] == [
+        "group 0", "group 0", "group 2", "group 2", "group 4"
+    ]
+
+
+def test_unreachable_upstream_fails_each_image_of_the_group(monkeypatch):
+    def unreachable(messages):
+        raise requests.ConnectionError("connection refused")
+
+    monkeypatch.setattr(meal_app, "_request_meal_analysis", unreachable)
+    response = _post_batch(TestClient(meal_app.app), 2, "batch-unreachable")
+    assert response.status_code == 200
+    assert [result["error"] for result in response.json()["results"]] == [
+        "OpenRouter is unreachable. Please try again later."
+    ] * 2
@@ -0,0 +1,338 @@
+"""Production launcher for the StressOFF gateway.
+
+Two modes::
+
+    # N workers of the combined gateway (backend/main.py)
+    python -m backend.serve --workers 4
+
+    # every service's create_app() in its own worker pool, behind a
+    # keep-alive proxy gateway; pools are sized per service
+    python -m backend.serve --split --workers 2 --pool meal=3 --pool coach=2
+
+Workers use uvloop and httptools when installed (see backend/requirements.txt).
+In split mode CPU-heavy meal image processing and long-lived coach streams
+no longer share a process (or a GIL) with the other routes. On SIGTERM or
+SIGINT the gateway stops accepting connections first, then every pool drains
+its in-flight requests and streams within ``--graceful-timeout`` seconds.
+
+Every worker process has its own upstream scheduler, circuit breakers, retry
+budget and SWR cache. ``UPSTREAM_MAX_CONCURRENCY`` is meant as a total, so the
+launcher divides it between all processes that call OpenRouter and refuses
+to start more processes than it allows (see :func:`share_upstream_limits`).
+The per-user ``UPSTREAM_USER_RATE`` and ``UPSTREAM_USER_BURST`` stay per
+process: a user's calls to one route only reach that route's pool, and
+splitting them further would reject ordinary use. Breakers and the retry
+budget, which is a ratio of each process's own traffic, are still learned
+per process, and each process caches its own analyses. In split mode the operational endpoints of a service pool are
+proxied as ``/services/<name>/metrics``, ``/services/<name>/upstream/scheduler``
+and ``/services/<name>/debug/...``; each call is answered by one worker of the pool.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from backend.lazy_router import SERVICE_MODULES as SERVICES
+
+# Hop-by-hop headers are never forwarded by a proxy (RFC 9110, section 7.6.1).
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+}
+# Per-service endpoints reachable through the split gateway under /services/<name>.
+OPERATIONAL_PREFIXES = ("/metrics", "/upstream/", "/debug/")
+
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_parser() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def share_upstream_limits(processes: int, environ: Optional[dict] = None) -> dict[str, str]:
+    """Environment giving each of ``processes`` workers its share of the global concurrency cap.
+
+    Raises ``SystemExit`` when there are more processes than upstream slots,
+    since every process needs at least one and the total would be exceeded.
+    """
+    environ = os.environ if environ is None else environ
+    processes = max(1, processes)
+    max_concurrency = int(environ.get("UPSTREAM_MAX_CONCURRENCY", "8"))
+    if processes > max_concurrency:
+        raise SystemExit(
+            f"{processes} worker processes need at least one upstream slot each, but "
+            f"UPSTREAM_MAX_CONCURRENCY is {max_concurrency}; use fewer workers or raise it"
+        )
+    return {"UPSTREAM_MAX_CONCURRENCY": str(max_concurrency // processes)}
+
+
+def create_proxy_app() -> FastAPI:
+    """Gateway forwarding each route to its service pool.
+
+    The pools come from ``GATEWAY_UPSTREAMS``, a JSON object mapping service
+    names to base URLs. Request bodies are forwarded whole; responses are
+    streamed back chunk by chunk so SSE endpoints keep their latency.
+    """
+    import httpx
+
+    from backend.microservices.common.metrics import MetricsMiddleware, metrics_router
+
+    upstreams: dict[str, str] = json.loads(os.environ.get("GATEWAY_UPSTREAMS", "{}"))
+    routes = [
+        (prefix, upstreams[name]) for name, (_, prefixes) in SERVICES.items() if name in upstreams for prefix in prefixes
+    ]
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0, connect=5.0),
+        limits=httpx.Limits(max_connections=512, max_keepalive_connections=128, keepalive_expiry=30.0),
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        await client.aclose()
+
+    app = FastAPI(title="StressOFF API Gateway", version="1.0.0", lifespan=lifespan)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
+
+    @app.get("/")
+    async def root() -> dict:
+        return {
+            "message": "StressOFF API Gateway",
+            "mode": "split",
+            "upstreams": upstreams,
+            "operational": {name: f"/services/{name}/metrics" for name in upstreams},
+        }
+
+    def upstream_for(path: str) -> tuple[Optional[str], str]:
+        """Base URL of the pool serving ``path`` and the path to request there."""
+        if path.startswith("/services/"):
+            name, _, rest = path[len("/services/"):].partition("/")
+            rest = "/" + rest
+            if name in upstreams and rest.startswith(OPERATIONAL_PREFIXES):
+                return upstreams[name], rest
+            return None, path
+        for prefix, base_url in routes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return base_url, path
+        return None, path
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"], include_in_schema=False)
+    async def proxy(request: Request, path: str):
+        base_url, upstream_path = upstream_for(request.url.path)
+        if base_url is None:
+            return JSONResponse({"detail": "Not Found"}, status_code=404)
+        headers = [(key, value) for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS]
+        if "accept-encoding" not in request.headers:
+            # Otherwise httpx adds its own and the raw, compressed body reaches
+            # a client that never asked for it.
+            headers.append(("accept-encoding", "identity"))
+        if request.client is not None:
+            forwarded_for = request.headers.get("x-forwarded-for")
+            client_host = request.client.host
+            headers = [(key, value) for key, value in headers if key.lower() != "x-forwarded-for"]
+            headers.append(("x-forwarded-for", f"{forwarded_for}, {client_host}" if forwarded_for else client_host))
+        upstream_request = client.build_request(
+            request.method,
+            base_url + upstream_path,
+            params=request.query_params,
+            headers=headers,
+            content=await request.body(),
+        )
+        try:
+            response = await client.send(upstream_request, stream=True)
+        except httpx.HTTPError as exc:
+            print(f"[Gateway] upstream {base_url} unreachable: {exc}")
+            return JSONResponse({"detail": "Service unavailable"}, status_code=503, headers={"Retry-After": "1"})
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers={key: value for key, value in response.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS},
+            background=BackgroundTask(response.aclose),
+        )
+
+    return app
+
+
+def _uvicorn_command(
+    target: str,
+    host: str,
+    port: int,
+    workers: int,
+    args: argparse.Namespace,
+    factory: bool = False,
+) -> list[str]:
+    command = [
+        sys.executable, "-m", "uvicorn", target,
+        "--host", host,
+        "--port", str(port),
+        "--workers", str(workers),
+        "--loop", event_loop(),
+        "--http", http_parser(),
+        "--timeout-graceful-shutdown", str(args.graceful_timeout),
+        "--timeout-keep-alive", "30",
+        "--log-level", args.log_level,
+    ]
+    if factory:
+        command.append("--factory")
+    return command
+
+
+def _parse_pools(values: list[str], default: int) -> dict[str, int]:
+    pools = {name: default for name in SERVICES}
+    for value in values:
+        name, _, size = value.partition("=")
+        if name not in SERVICES:
+            raise SystemExit(f"Unknown service '{name}', expected one of {', '.join(SERVICES)}")
+        pools[name] = int(size)
+    return pools
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 30.0) -> None:
+    import socket
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{host}:{port} did not come up within {timeout}s")
+
+
+def _stop(processes: list[subprocess.Popen], timeout: float) -> None:
+    """SIGTERM ``processes`` together and wait for them to drain, killing stragglers.
+
+    uvicorn treats a second signal as a forced exit, so each process is only
+    signalled once.
+    """
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + timeout + 5
+    for process in processes:
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            print(f"[Gateway] pid {process.pid} did not drain in time, killing it")
+            process.kill()
+
+
+def run_split(args: argparse.Namespace) -> None:
+    pools = _parse_pools(args.pool, args.service_workers)
+    service_env = dict(os.environ, **share_upstream_limits(sum(size for size in pools.values() if size > 0)))
+    upstreams: dict[str, str] = {}
+    services: list[subprocess.Popen] = []
+    gateway: Optional[subprocess.Popen] = None
+    stopping = False
+
+    def shutdown(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    # Installed before the first child is spawned, so a signal at any point
+    # still reaches the finally block below that stops them.
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    try:
+        for offset, (name, (module, _)) in enumerate(SERVICES.items(), start=1):
+            if pools[name] <= 0 or stopping:
+                continue
+            port = args.service_port_base + offset
+            # Own sessions keep a terminal Ctrl+C away from the children: only this
+            # process decides when and in which order they drain.
+            services.append(
+                subprocess.Popen(
+                    _uvicorn_command(f"{module}:app", "127.0.0.1", port, pools[name], args),
+                    env=service_env,
+                    start_new_session=True,
+                )
+            )
+            upstreams[name] = f"http://127.0.0.1:{port}"
+            print(f"[Gateway] {name}: {pools[name]} worker(s) on port {port}")
+
+        for url in upstreams.values():
+            if stopping:
+                break
+            _wait_for_port("127.0.0.1", int(url.rsplit(":", 1)[1]))
+        if stopping:
+            return
+        gateway = subprocess.Popen(
+            _uvicorn_command("backend.serve:create_proxy_app", args.host, args.port, args.workers, args, factory=True),
+            env=dict(os.environ, GATEWAY_UPSTREAMS=json.dumps(upstreams)),
+            start_new_session=True,
+        )
+        print(f"[Gateway] proxy: {args.workers} worker(s) on {args.host}:{args.port}")
+        while not stopping and all(process.poll() is None for process in [gateway, *services]):
+            time.sleep(0.5)
+    finally:
+        print("[Gateway] shutting down, draining in-flight requests")
+        # Stop accepting traffic first, then let every pool finish its streams.
+        _stop([gateway] if gateway is not None else [], args.graceful_timeout)
+        _stop(services, args.graceful_timeout)
+
+
+def main() -> None:  # pragma: no cover - CLI entry point
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="gateway worker processes; at most UPSTREAM_MAX_CONCURRENCY without --split",
+    )
+    parser.add_argument("--split", action="store_true", help="run every service in its own worker pool")
+    parser.add_argument("--service-workers", type=int, default=1, help="default pool size per service in --split")
+    parser.add_argument("--pool", action="append", default=[], help="pool size of one service, e.g. meal=4 (0 disables it)")
+    parser.add_argument("--service-port-base", type=int, default=9000)
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to drain in-flight requests")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    print(f"[Gateway] event loop: {event_loop()}, HTTP parser: {http_parser()}")
+    if args.split:
+        run_split(args)
+        return
+
+    import uvicorn
+
+    # Workers are spawned with this environment and read it on import.
+    os.environ.update(share_upstream_limits(args.workers))
+    uvicorn.run(
+        "backend.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=event_loop(),
+        http=http_parser(),
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=30,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -3,26 +3,51 @@ Realistic Smartwatch Health Data Simulator
 Generates 24h health cycles with natural patterns and sends to Firestore
 """
 import os
+import abc
+import gzip
 import time
 import math
+import json
+import queue
+import asyncio
 import random
+import sqlite3
+import zipfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict
-import firebase_admin
-from firebase_admin import credentials, firestore
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+
+SERVICE_ACCOUNT_KEY = os.environ.get('SERVICE_ACCOUNT_KEY', "serviceAccountKey.json")  # UPDATE THIS PATH
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_db():
+    """Initialize Firebase on first use so the simulator can be imported and run offline"""
+    global _db
+    with _db_lock:
+        if _db is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+
+            cred = credentials.Certificate(SERVICE_ACCOUNT_KEY)
+            firebase_admin.initialize_app(cred)
+            _db = firestore.client()
+    return _db
 
-# Initialize Firebase
-cred = credentials.Certificate("serviceAccountKey.json")  # UPDATE THIS PATH
-firebase_admin.initialize_app(cred)
-db = firestore.client()
 
 # User configuration
 USER_ID = "V8Fj1w8CJhPJsUgu2mB4XDPzEJs2"  # UPDATE WITH REAL USER ID
 INTERVAL_MINUTES = 1  # Send data every 1 minutes
 
 class HealthSimulator:
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, sink: Optional['Sink'] = None):
         self.user_id = user_id
+        self.sink = sink
         self.start_time = datetime.now()
         self.base_resting_hr = 60
         self.base_hrv = 50
@@ -182,7 +207,7 @@ class HealthSimulator:
                 data['date'] = datetime.fromisoformat(data['date'])
 
             # Send to user's subcollection: users/{userId}/{collection}
-            db.collection('users').document(self.user_id).collection(collection).document(doc_id).set(data)
+            get_db().collection('users').document(self.user_id).collection(collection).document(doc_id).set(data)
 
             log_value = data.get('timestamp', data.get('date'))
             if isinstance(log_value, datetime):
@@ -191,29 +216,924 @@ class HealthSimulator:
         except Exception as e:
             print(f"✗ Error sending to Firestore: {e}")
 
+    def send(self, collection: str, data: Dict):
+        """Send data through the sink, or straight to Firestore without one"""
+        if self.sink is None:
+            self.send_to_firestore(collection, data)
+            return
+        self.sink.write(collection, data)
+        print(f"✓ Queued {collection}: {data.get('timestamp', data.get('date'))}")
+
     def run_simulation(self):
         """Run continuous simulation"""
         print(f"🏃 Starting health data simulation for user: {self.user_id}")
         print(f"📊 Sending data every {INTERVAL_MINUTES} minutes")
 
         last_sleep_date = None
+        started = time.monotonic()
+        tick = 0
+
+        try:
+            while True:
+                current_time = datetime.now()
+
+                # Generate and send health metrics
+                metrics = self.generate_metrics(current_time)
+                self.send('health_metrics', metrics)
+
+                # Send sleep data once per day (morning)
+                if current_time.hour == 00 and current_time.date() != last_sleep_date:
+                    sleep_data = self.generate_sleep_data(current_time)
+                    self.send('sleep_data', sleep_data)
+                    last_sleep_date = current_time.date()
+
+                # Wait for the next interval, counted from the start so send time does not add up
+                tick += 1
+                time.sleep(max(0.0, started + tick * INTERVAL_MINUTES * 60 - time.monotonic()))
+        finally:
+            if self.sink is not None:
+                self.sink.close()
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+FIRESTORE_BATCH_LIMIT = 500  # Firestore rejects write batches with more operations
+# The backend has no ingest endpoint, so there is no default: the http sink needs a collector of your own
+# that accepts {"records": [...]}, e.g. http://localhost:9000/ingest/{collection}.
+INGEST_URL = os.environ.get('SIMULATOR_INGEST_URL')
+RETRY_BACKOFF_SECONDS = 0.5
+
+
+def document_id(data: Dict) -> str:
+    """Document id from the user and the sample's own timestamp or date
+
+    Unlike the send time, it cannot collide when many samples are written in
+    the same millisecond, and a retried write overwrites instead of duplicating.
+    """
+    moment = data.get('timestamp', data.get('date'))
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    return f"{data['userId']}_{int(moment.timestamp() * 1000)}"
+
+
+def _with_datetimes(data: Dict) -> Dict:
+    """Copy of data with ISO timestamp and date strings converted to datetime, as Firestore stores them"""
+    data = dict(data)
+    for key in ('timestamp', 'date'):
+        if isinstance(data.get(key), str):
+            data[key] = datetime.fromisoformat(data[key])
+    return data
+
+
+def _with_iso_strings(data: Dict) -> Dict:
+    """Copy of data with datetimes converted to ISO strings for JSON"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in data.items()}
+
+
+class SinkStats:
+    """Throughput counters shared by a sink's worker threads"""
+
+    def __init__(self):
+        self.records = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.records / max(self.elapsed, 1e-9)
+
+
+class Sink(abc.ABC):
+    """Destination for simulated records, written in batches by background threads
+
+    write() only buffers. Full batches are handed to the worker threads through
+    a bounded queue, so a slow destination slows the producer down instead of
+    growing memory, and a flusher thread queues the partial batch after
+    flush_interval seconds without new batches. Batches are only ever taken
+    from _pending and queued under _pending_lock, so flush() cannot miss one in
+    transit. A failed batch is retried with exponential backoff and dropped
+    after max_retries. Subclasses implement _commit; max_workers caps the
+    threads for destinations whose handle cannot be shared.
+    """
+    name = 'sink'
+    default_batch_size = FIRESTORE_BATCH_LIMIT
+    default_workers = 1
+    max_workers: Optional[int] = None
+
+    def __init__(self, batch_size: Optional[int] = None, workers: Optional[int] = None, max_retries: int = 3,
+                 flush_interval: float = 1.0, max_pending_batches: int = 16):
+        workers = workers or self.default_workers
+        if self.max_workers is not None and workers > self.max_workers:
+            raise ValueError(f"the {self.name} sink supports at most {self.max_workers} worker(s), got {workers}")
+        self.batch_size = batch_size or self.default_batch_size
+        self.max_retries = max_retries
+        self.flush_interval = flush_interval
+        self.stats = SinkStats()
+        self._pending: List = []
+        self._pending_lock = threading.Lock()
+        self._queued_at = time.monotonic()
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._closing = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{self.name}-sink-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        self._flusher = threading.Thread(target=self._flush_when_idle, name=f"{self.name}-sink-flusher", daemon=True)
+        for thread in self._threads + [self._flusher]:
+            thread.start()
+
+    def write(self, collection: str, data: Dict):
+        record = dict(data)
+        record.setdefault('id', document_id(record))
+        with self._pending_lock:
+            self._pending.append((collection, record))
+            if len(self._pending) >= self.batch_size:
+                self._queue_pending()
+
+    def flush(self):
+        """Commit everything written so far"""
+        with self._pending_lock:
+            self._queue_pending()
+        self._queue.join()
+
+    def close(self):
+        self._closing.set()
+        self._flusher.join()
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._close()
+        self.report()
+
+    def report(self):
+        stats = self.stats
+        print(f"📈 {self.name}: {stats.records:,} records in {stats.batches:,} batches, {stats.elapsed:.1f}s "
+              f"({stats.rate:,.0f}/s), {stats.retries} retries, {stats.dropped:,} dropped")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _queue_pending(self):
+        """Hand the pending records to the workers; the caller holds _pending_lock"""
+        if self._pending:
+            batch, self._pending = self._pending, []
+            # Blocks while the queue is full, which holds back write() as well.
+            self._queue.put(batch)
+        self._queued_at = time.monotonic()
 
+    def _flush_when_idle(self):
+        while not self._closing.wait(self.flush_interval / 2):
+            with self._pending_lock:
+                if time.monotonic() - self._queued_at >= self.flush_interval:
+                    self._queue_pending()
+
+    def _worker(self):
         while True:
-            current_time = datetime.now()
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                self._commit_with_retry(batch)
+            finally:
+                self._queue.task_done()
+
+    def _commit_with_retry(self, batch: List):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._commit(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.stats.add(dropped=len(batch))
+                    print(f"✗ {self.name}: dropped {len(batch)} records after {attempt + 1} attempts: {e}")
+                    return
+                self.stats.add(retries=1)
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+            else:
+                self.stats.add(records=len(batch), batches=1)
+                return
+
+    @abc.abstractmethod
+    def _commit(self, batch: List):
+        """Write a list of (collection, record) pairs"""
+
+    def _close(self):
+        pass
+
+
+class FirestoreBatchSink(Sink):
+    """Firestore write batches of up to 500 sets into users/{userId}/{collection}"""
+    name = 'firestore'
+    default_workers = 4
+
+    def __init__(self, batch_size: Optional[int] = None, **options):
+        super().__init__(min(batch_size or FIRESTORE_BATCH_LIMIT, FIRESTORE_BATCH_LIMIT), **options)
+
+    def _commit(self, batch: List):
+        db = get_db()
+        write_batch = db.batch()
+        for collection, record in batch:
+            ref = db.collection('users').document(record['userId']).collection(collection).document(record['id'])
+            write_batch.set(ref, _with_datetimes(record))
+        write_batch.commit()
+
+
+class HttpSink(Sink):
+    """POSTs gzip-compressed JSON batches to an ingest collector, one request per collection
+
+    The body is {"records": [...]}. A retry resends the whole batch; records
+    carry their document id so the collector can upsert them. The URL template
+    comes from the target or SIMULATOR_INGEST_URL; the backend has no ingest
+    endpoint, so there is no default.
+    """
+    name = 'http'
+    default_workers = 4
+
+    def __init__(self, url: Optional[str] = None, timeout: float = 30, **options):
+        url = url or INGEST_URL
+        if not url:
+            raise ValueError('the http sink needs a collector URL: pass --target or set SIMULATOR_INGEST_URL '
+                             '(the backend has no ingest endpoint)')
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+        super().__init__(**options)
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = self._local.session = requests.Session()
+        return session
+
+    def _commit(self, batch: List):
+        by_collection: Dict[str, List[Dict]] = {}
+        for collection, record in batch:
+            by_collection.setdefault(collection, []).append(_with_iso_strings(record))
+        for collection, records in by_collection.items():
+            body = gzip.compress(json.dumps({'records': records}).encode('utf-8'), compresslevel=5)
+            response = self._session().post(
+                self.url.format(collection=collection),
+                data=body,
+                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+
+
+class FileSink(Sink):
+    """Appends records as NDJSON to {directory}/{collection}.ndjson"""
+    name = 'file'
+    max_workers = 1  # the file handles are not shared between threads
+
+    def __init__(self, directory: str = 'simulated_live', **options):
+        self.directory = directory
+        self._handles = {}
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(**options)
+
+    def _commit(self, batch: List):
+        lines: Dict[str, List[str]] = {}
+        for collection, record in batch:
+            lines.setdefault(collection, []).append(json.dumps(_with_iso_strings(record)))
+        for collection, collection_lines in lines.items():
+            handle = self._handles.get(collection)
+            if handle is None:
+                handle = self._handles[collection] = open(os.path.join(self.directory, f"{collection}.ndjson"), 'a')
+            handle.write('\n'.join(collection_lines) + '\n')
+            handle.flush()
+
+    def _close(self):
+        for handle in self._handles.values():
+            handle.close()
+
+
+class SQLiteSink(Sink):
+    """Upserts records into a local SQLite database, one transaction per batch"""
+    name = 'sqlite'
+    max_workers = 1  # one connection, not shared between threads
+
+    def __init__(self, path: str = 'simulated_health.db', **options):
+        self.path = path
+        self._connection = None
+        super().__init__(**options)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Used by the single worker thread, then closed from the thread calling close().
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS records ('
+                'collection TEXT NOT NULL, id TEXT NOT NULL, user_id TEXT NOT NULL, '
+                'timestamp TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (collection, id))'
+            )
+        return self._connection
+
+    def _commit(self, batch: List):
+        rows = []
+        for collection, record in batch:
+            record = _with_iso_strings(record)
+            rows.append((collection, record['id'], record['userId'], record.get('timestamp', record.get('date')),
+                         json.dumps(record)))
+        connection = self._connect()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)', rows)
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+
+SINKS = {'firestore': FirestoreBatchSink, 'file': FileSink, 'sqlite': SQLiteSink, 'http': HttpSink}
+
+
+def make_sink(kind: str, target: Optional[str] = None, **options) -> Sink:
+    """Sink by name; target is the directory, database path or URL template it writes to"""
+    if target is not None and kind != 'firestore':
+        key = {'file': 'directory', 'sqlite': 'path', 'http': 'url'}[kind]
+        options[key] = target
+    return SINKS[kind](**options)
+
+
+# ---------------------------------------------------------------------------
+# Bulk history generation
+# ---------------------------------------------------------------------------
+
+MINUTES_PER_DAY = 24 * 60
+BULK_USER_CHUNK = 1000  # users generated together; part of the reproducibility key
+NPZ_COMPRESS_LEVEL = 1  # deflate level; np.savez_compressed's level 6 is ~7x slower for ~15% smaller files
+METRIC_FIELDS = ('heartRate', 'restingHeartRate', 'hrv', 'steps', 'calories', 'activeMinutes', 'spo2', 'is_sleeping')
+SLEEP_FIELDS = ('durationHours', 'qualityScore', 'deepSleepMinutes', 'remSleepMinutes', 'lightSleepMinutes')
+
+
+@lru_cache(maxsize=None)
+def circadian_table() -> Dict[str, np.ndarray]:
+    """Per-minute lookup table of get_time_of_day_factor over one day"""
+    simulator = HealthSimulator('table')
+    midnight = datetime(2000, 1, 1)
+    rows = [simulator.get_time_of_day_factor(midnight + timedelta(minutes=m)) for m in range(MINUTES_PER_DAY)]
+    table = {
+        key: np.array([row[key] for row in rows], dtype=np.float64)
+        for key in ('hr_multiplier', 'hrv_multiplier', 'activity')
+    }
+    table['is_sleeping'] = np.array([row['is_sleeping'] for row in rows], dtype=bool)
+    for array in table.values():
+        array.flags.writeable = False
+    return table
+
 
-            # Generate and send health metrics
-            metrics = self.generate_metrics(current_time)
-            self.send_to_firestore('health_metrics', metrics)
+def bulk_user_ids(count: int, prefix: str = 'sim-user') -> List[str]:
+    return [f"{prefix}-{index:05d}" for index in range(count)]
+
+
+def generate_bulk_day(n_users: int, interval_minutes: int, rng: np.random.Generator,
+                      base_resting_hr=60, base_hrv=50, minutes: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """One day of metrics for n_users as (users, samples) arrays, same model as generate_metrics
+
+    minutes restricts the samples to those minutes of the day, and the
+    baselines may be (users, 1) arrays to give every user their own.
+    """
+    table = circadian_table()
+    if minutes is None:
+        minutes = np.arange(0, MINUTES_PER_DAY, interval_minutes)
+    shape = (n_users, minutes.size)
+    hr_multiplier = table['hr_multiplier'][minutes]
+    hrv_multiplier = table['hrv_multiplier'][minutes]
+    activity = table['activity'][minutes]
+
+    hr = base_resting_hr * hr_multiplier + rng.normal(0, 2, shape)
+    resting_hr = base_resting_hr + rng.normal(0, 1, shape)
+    hrv = base_hrv * hrv_multiplier + rng.normal(0, 3, shape)
+    steps = (activity * rng.uniform(100, 300, shape)).astype(np.int32)
+    calories = (1.2 + activity * 5) * interval_minutes
+    active_minutes = (activity * interval_minutes).astype(np.int32)
+    spo2 = np.clip(97 + rng.normal(0, 0.5, shape), 94, 100)
+
+    return {
+        'heartRate': np.round(np.clip(hr, 45, 120), 1).astype(np.float32),
+        'restingHeartRate': np.round(np.clip(resting_hr, 50, 75), 1).astype(np.float32),
+        'hrv': np.round(np.clip(hrv, 20, 100), 1).astype(np.float32),
+        'steps': steps,
+        'calories': np.broadcast_to(np.round(calories, 1).astype(np.float32), shape),
+        'activeMinutes': np.broadcast_to(active_minutes, shape),
+        'spo2': np.round(spo2, 1).astype(np.float32),
+        'is_sleeping': np.broadcast_to(table['is_sleeping'][minutes], shape),
+    }
+
+
+def generate_bulk_sleep(n_users: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """One night of sleep data per user, same model as generate_sleep_data"""
+    duration = np.clip(rng.normal(7.5, 0.5, n_users), 5.5, 9.5)
+    quality = np.clip(70 + (duration - 6) * 5 + rng.normal(0, 5, n_users), 40, 100)
+    total_minutes = (duration * 60).astype(np.int32)
+    deep_pct = 0.15 + rng.uniform(-0.03, 0.03, n_users)
+    rem_pct = 0.25 + rng.uniform(-0.05, 0.05, n_users)
+    light_pct = 1 - deep_pct - rem_pct
+    return {
+        'durationHours': np.round(duration, 2).astype(np.float32),
+        'qualityScore': np.round(quality, 1).astype(np.float32),
+        'deepSleepMinutes': (total_minutes * deep_pct).astype(np.int32),
+        'remSleepMinutes': (total_minutes * rem_pct).astype(np.int32),
+        'lightSleepMinutes': (total_minutes * light_pct).astype(np.int32),
+    }
+
+
+def generate_bulk(user_ids: List[str], start_date: datetime, days: int, interval_minutes: int = INTERVAL_MINUTES,
+                  seed: int = 0, chunk_size: int = BULK_USER_CHUNK) -> Iterator[Dict]:
+    """Yield one block per (day, user chunk) with metric and sleep arrays
+
+    Every block draws from its own generator seeded with (seed, day, chunk),
+    so the output is reproducible for a given seed and chunk size and blocks
+    can be generated in any order.
+    """
+    start = datetime(start_date.year, start_date.month, start_date.day)
+    for day in range(days):
+        date = start + timedelta(days=day)
+        for chunk_index, first in enumerate(range(0, len(user_ids), chunk_size)):
+            chunk = user_ids[first:first + chunk_size]
+            rng = np.random.default_rng([seed, day, chunk_index])
+            yield {
+                'date': date,
+                'userIds': chunk,
+                'minutes': np.arange(0, MINUTES_PER_DAY, interval_minutes),
+                'metrics': generate_bulk_day(len(chunk), interval_minutes, rng),
+                'sleep': generate_bulk_sleep(len(chunk), rng),
+            }
+
+
+def _json_column(values: np.ndarray) -> list:
+    """Python values for JSON, without float32 artifacts such as 45.70000076"""
+    if np.issubdtype(values.dtype, np.floating):
+        return np.round(values.astype(np.float64), 2).tolist()
+    return values.tolist()
+
+
+def _json_literals(values: np.ndarray) -> list:
+    """Column values that format with %s exactly as json.dumps writes them"""
+    if values.dtype == np.bool_:
+        return np.where(values, 'true', 'false').tolist()
+    return _json_column(values)
+
+
+def write_bulk_ndjson(block: Dict, directory: str, append: bool = True) -> int:
+    """Write a block to health_metrics.ndjson and sleep_data.ndjson; returns rows written
+
+    Metric lines are formatted from whole columns with one %-template per
+    user rather than a dict and json.dumps per record; the output is the same.
+    append=False truncates both files first so a rerun replaces the previous history
+    """
+    mode = 'a' if append else 'w'
+    date = block['date']
+    timestamps = [(date + timedelta(minutes=int(m))).isoformat() for m in block['minutes']]
+    columns = [_json_literals(block['metrics'][field]) for field in METRIC_FIELDS]
+    fields = ''.join(f', "{field}": %s' for field in METRIC_FIELDS)
+    rows = 0
+    with open(os.path.join(directory, 'health_metrics.ndjson'), mode) as handle:
+        for user_index, user_id in enumerate(block['userIds']):
+            user = json.dumps(user_id).replace('%', '%%')
+            template = '{"userId": ' + user + ', "timestamp": "%s"' + fields + '}\n'
+            handle.write(''.join(map(template.__mod__, zip(timestamps, *(column[user_index] for column in columns)))))
+            rows += len(timestamps)
+    sleep = {field: _json_column(block['sleep'][field]) for field in SLEEP_FIELDS}
+    with open(os.path.join(directory, 'sleep_data.ndjson'), mode) as handle:
+        for user_index, user_id in enumerate(block['userIds']):
+            record = {'userId': user_id, 'date': date.isoformat()}
+            record.update((field, sleep[field][user_index]) for field in SLEEP_FIELDS)
+            handle.write(json.dumps(record) + '\n')
+    return rows
+
+
+def iter_bulk_records(block: Dict) -> Iterator:
+    """(collection, record) pairs of a block in the shape generate_metrics and generate_sleep_data return"""
+    date = block['date']
+    timestamps = [(date + timedelta(minutes=int(m))).isoformat() for m in block['minutes']]
+    columns = {field: _json_column(block['metrics'][field]) for field in METRIC_FIELDS}
+    sleep = {field: _json_column(block['sleep'][field]) for field in SLEEP_FIELDS}
+    for user_index, user_id in enumerate(block['userIds']):
+        values = [columns[field][user_index] for field in METRIC_FIELDS]
+        for sample, timestamp in enumerate(timestamps):
+            record = {'userId': user_id, 'timestamp': timestamp}
+            record.update(zip(METRIC_FIELDS, (column[sample] for column in values)))
+            yield 'health_metrics', record
+        record = {'userId': user_id, 'date': date.isoformat()}
+        record.update((field, sleep[field][user_index]) for field in SLEEP_FIELDS)
+        yield 'sleep_data', record
+
+
+def write_bulk_sink(block: Dict, sink: Sink) -> int:
+    """Write a block through a sink; returns metric rows written"""
+    rows = 0
+    for collection, record in iter_bulk_records(block):
+        sink.write(collection, record)
+        rows += collection == 'health_metrics'
+    return rows
+
+
+def write_bulk_npz(block: Dict, directory: str, chunk_index: int) -> int:
+    """Write a block as one compressed columnar .npz file of (users, samples) arrays; returns rows written
+
+    calories, activeMinutes and is_sleeping only depend on the time of day,
+    so they are stored once per sample instead of once per user and sample.
+    The file is what np.savez_compressed writes, at a faster deflate level:
+    about 9 MB per 1000 users and day at one-minute resolution instead of 29 MB
+    uncompressed, so a year for 10k users takes about 35 GB. np.load reads it.
+    """
+    date = block['date']
+    path = os.path.join(directory, f"metrics-{date.date().isoformat()}-{chunk_index:03d}.npz")
+    timestamps = np.datetime64(date.date()) + block['minutes'].astype('timedelta64[m]')
+    metrics = dict(block['metrics'])
+    for field in ('calories', 'activeMinutes', 'is_sleeping'):
+        metrics[field] = metrics[field][0]
+    arrays = {
+        'userIds': np.array(block['userIds']),
+        'timestamps': timestamps,
+        **metrics,
+        **{f"sleep_{field}": values for field, values in block['sleep'].items()},
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=NPZ_COMPRESS_LEVEL) as archive:
+        for name, values in arrays.items():
+            with archive.open(f"{name}.npy", 'w', force_zip64=True) as member:
+                np.lib.format.write_array(member, np.asanyarray(values), allow_pickle=False)
+    return block['metrics']['heartRate'].size
+
+
+def run_bulk(users: int, days: int, start_date: datetime, out_dir: str, file_format: str = 'npz',
+             interval_minutes: int = INTERVAL_MINUTES, seed: int = 0, chunk_size: int = BULK_USER_CHUNK,
+             sink: Optional[Sink] = None):
+    """Generate days x users of history and write it to out_dir, or through sink when given"""
+    if sink is None:
+        os.makedirs(out_dir, exist_ok=True)
+    user_ids = bulk_user_ids(users)
+    started = time.perf_counter()
+    rows = 0
+    chunks_per_day = max(1, math.ceil(users / chunk_size))
+    for index, block in enumerate(generate_bulk(user_ids, start_date, days, interval_minutes, seed, chunk_size)):
+        if sink is not None:
+            rows += write_bulk_sink(block, sink)
+        elif file_format == 'ndjson':
+            rows += write_bulk_ndjson(block, out_dir, append=index > 0)
+        else:
+            rows += write_bulk_npz(block, out_dir, index % chunks_per_day)
+        if (index + 1) % chunks_per_day == 0:
+            elapsed = time.perf_counter() - started
+            print(f"📅 {block['date'].date()} done: {rows:,} samples in {elapsed:.1f}s ({rows / elapsed:,.0f}/s)")
+    if sink is not None:
+        sink.close()
+        out_dir = sink.name
+    elapsed = time.perf_counter() - started
+    print(f"✓ Generated {rows:,} samples for {users} users x {days} days in {elapsed:.1f}s -> {out_dir}")
+
+
+# ---------------------------------------------------------------------------
+# Concurrent live simulation
+# ---------------------------------------------------------------------------
+
+SWARM_SLOTS = 60  # watches are spread over this many send times per interval
+SWARM_REPORT_SECONDS = 10
+ANALYSIS_FIELDS = METRIC_FIELDS[:-1]  # HealthMetric has no is_sleeping
+
+
+class WatchFleet:
+    """Array-backed state of many virtual watches
+
+    Each watch is one row: its own resting heart rate and HRV baselines, its
+    last night's sleep, and a ring buffer of its latest samples for analysis
+    requests. 10,000 watches with a one-hour window of one-minute samples
+    take about 20 MB.
+    """
+
+    def __init__(self, user_ids: List[str], window: int, seed: int = 0):
+        n_users = len(user_ids)
+        self.user_ids = user_ids
+        self.window = window
+        self.rng = np.random.default_rng(seed)
+        self.base_resting_hr = np.clip(self.rng.normal(60, 5, n_users), 48, 75).astype(np.float32)
+        self.base_hrv = np.clip(self.rng.normal(50, 10, n_users), 25, 90).astype(np.float32)
+        self.samples = np.zeros(n_users, dtype=np.int64)
+        self.recent = np.zeros((n_users, window, len(ANALYSIS_FIELDS)), dtype=np.float32)
+        self.recent_times = np.zeros((n_users, window), dtype='datetime64[s]')
+        self.sleep = np.zeros((n_users, len(SLEEP_FIELDS)), dtype=np.float32)
+        self.sleep_day = np.full(n_users, -1, dtype=np.int32)  # ordinal of the last night generated
+
+    def sample(self, users: np.ndarray, moment: datetime, interval_minutes: int) -> Dict[str, np.ndarray]:
+        """One sample per watch in users at moment, also kept in their ring buffers"""
+        minute = np.array([moment.hour * 60 + moment.minute])
+        metrics = generate_bulk_day(users.size, interval_minutes, self.rng, self.base_resting_hr[users, None],
+                                    self.base_hrv[users, None], minutes=minute)
+        columns = {field: metrics[field][:, 0] for field in METRIC_FIELDS}
+        position = self.samples[users] % self.window
+        self.recent[users, position] = np.stack([columns[field] for field in ANALYSIS_FIELDS], axis=1)
+        self.recent_times[users, position] = np.datetime64(moment, 's')
+        self.samples[users] += 1
+        return columns
+
+    def sleep_due(self, users: np.ndarray, moment: datetime) -> np.ndarray:
+        """Watches in users that report last night's sleep now (once per day, just after midnight)"""
+        if moment.hour != 0:
+            return users[:0]
+        return users[self.sleep_day[users] != moment.toordinal()]
+
+    def sample_sleep(self, users: np.ndarray, moment: datetime) -> Dict[str, np.ndarray]:
+        columns = generate_bulk_sleep(users.size, self.rng)
+        self.sleep[users] = np.stack([columns[field] for field in SLEEP_FIELDS], axis=1)
+        self.sleep_day[users] = moment.toordinal()
+        return columns
+
+    def analysis_due(self, users: np.ndarray) -> np.ndarray:
+        """Watches in users whose ring buffer has filled up again since their last analysis request"""
+        return users[self.samples[users] % self.window == 0]
+
+    def analysis_request(self, user: int, moment: datetime) -> Dict:
+        """/analyze-health body for one watch's latest window"""
+        order = np.argsort(self.recent_times[user])
+        metrics = []
+        for timestamp, values in zip(self.recent_times[user][order].tolist(), _json_column(self.recent[user][order])):
+            metric = {'timestamp': timestamp.isoformat()}
+            metric.update(zip(ANALYSIS_FIELDS, values))
+            metric['steps'] = int(metric['steps'])
+            metric['activeMinutes'] = int(metric['activeMinutes'])
+            metrics.append(metric)
+        request = {'userId': self.user_ids[user], 'date': moment.date().isoformat(), 'metrics': metrics}
+        if self.sleep_day[user] >= 0:
+            sleep = dict(zip(SLEEP_FIELDS, _json_column(self.sleep[user])))
+            for field in ('deepSleepMinutes', 'remSleepMinutes', 'lightSleepMinutes'):
+                sleep[field] = int(sleep[field])
+            request['sleepData'] = sleep
+        return request
+
+
+def slice_records(collection: str, user_ids: List[str], moment: datetime, columns: Dict[str, np.ndarray]) -> List[Dict]:
+    """Records for one sample per user, in the shape generate_metrics and generate_sleep_data return"""
+    key, value = ('timestamp', moment.isoformat()) if collection == 'health_metrics' else ('date', moment.date().isoformat())
+    fields = list(columns)
+    rows = zip(*(_json_column(columns[field]) for field in fields))
+    return [{'userId': user_id, key: value, **dict(zip(fields, row))} for user_id, row in zip(user_ids, rows)]
+
+
+class LoadStats:
+    """Counts, errors and latency percentiles of one kind of request since the last report"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.total = 0
+        self.errors = 0
+        self.skipped = 0
+        self.latencies: List[float] = []
+
+    def observe(self, seconds: float, ok: bool = True):
+        self.total += 1
+        self.errors += not ok
+        self.latencies.append(seconds)
+
+    def summary(self) -> str:
+        """One report line; latencies are reset so every report covers its own period"""
+        errors = f", {self.errors:,} errors" if self.errors else ''
+        if self.skipped:
+            errors += f", {self.skipped:,} skipped"
+        if not self.latencies:
+            return f"{self.name}: {self.total:,} total{errors}"
+        p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99]) * 1000
+        count = len(self.latencies)
+        self.latencies = []
+        return (f"{self.name}: {count:,} (total {self.total:,}{errors}) "
+                f"p50 {p50:.0f} ms p95 {p95:.0f} ms p99 {p99:.0f} ms")
+
+
+async def run_swarm(users: int, interval_minutes: int = INTERVAL_MINUTES, acceleration: float = 1.0,
+                    duration_minutes: Optional[int] = None, start: Optional[datetime] = None, seed: int = 0,
+                    sink: Optional[Sink] = None, ingest_url: Optional[str] = None, analyze_url: Optional[str] = None,
+                    analyze_every_minutes: int = 60, concurrency: int = 256, slots: int = SWARM_SLOTS,
+                    timeout: float = 30):
+    """Simulate many watches in one event loop
+
+    Every interval is split into slots and each watch sends in its own slot,
+    so requests are spread out instead of arriving together. Slot k fires at
+    started + k * slot length / acceleration, computed from the start rather
+    than from the previous slot, so slow sends never shift the schedule;
+    when the loop falls behind it catches up and the lag is reported.
+    Requests are not awaited by the schedule (open-loop load): concurrency
+    limits the connections in use, and once 16 x concurrency requests are
+    waiting for one, new requests are skipped and counted instead of
+    queueing without bound. Sink writes run on their own thread, since a
+    backed-up sink blocks in write(); when a whole interval of slots is
+    still waiting for it, further slots are skipped and counted the same way.
+    """
+    import httpx
+
+    user_ids = bulk_user_ids(users)
+    fleet = WatchFleet(user_ids, window=max(1, analyze_every_minutes // interval_minutes), seed=seed)
+    slots = max(1, min(slots, users))
+    slot_step = timedelta(minutes=interval_minutes) / slots
+    wall_step = slot_step.total_seconds() / acceleration
+    total_slots = None if duration_minutes is None else duration_minutes * slots // interval_minutes
+    sim_start = start or datetime.now()
+
+    loop = asyncio.get_running_loop()
+    client = None
+    if ingest_url or analyze_url:
+        client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency,
+                                                                         max_keepalive_connections=concurrency))
+    sink_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='swarm-sink') if sink is not None else None
+    semaphore = asyncio.Semaphore(concurrency)
+    max_in_flight = 16 * concurrency
+    in_flight = set()
+    sink_writes = set()
+    lag = LoadStats('schedule lag')
+    stored = LoadStats('sink writes')
+    ingest = LoadStats('ingest')
+    analysis = LoadStats('analysis')
+
+    async def post(stats: LoadStats, url: str, body: Dict):
+        async with semaphore:
+            sent = loop.time()
+            try:
+                response = await client.post(url, json=body)
+                stats.observe(loop.time() - sent, response.status_code < 400)
+            except httpx.HTTPError:
+                stats.observe(loop.time() - sent, False)
+
+    def submit(stats: LoadStats, url: str, body: Dict):
+        if len(in_flight) >= max_in_flight:
+            stats.skipped += 1
+            return
+        task = loop.create_task(post(stats, url, body))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    def write_records(collection: str, records: List[Dict]):
+        for record in records:
+            sink.write(collection, record)
+
+    def store(collection: str, records: List[Dict]):
+        if len(sink_writes) >= slots:
+            stored.skipped += 1
+            return
+        handed = loop.time()
+        future = loop.run_in_executor(sink_thread, write_records, collection, records)
+        sink_writes.add(future)
+
+        def written(future):
+            sink_writes.discard(future)
+            stored.observe(loop.time() - handed, not future.cancelled() and future.exception() is None)
+
+        future.add_done_callback(written)
+
+    def deliver(collection: str, records: List[Dict]):
+        if sink is not None:
+            store(collection, records)
+        if ingest_url:
+            url = ingest_url.format(collection=collection)
+            for record in records:
+                submit(ingest, url, {'records': [record]})
+
+    def report(moment: datetime):
+        elapsed = loop.time() - started
+        print(f"⌚ {moment:%Y-%m-%d %H:%M} simulated, {elapsed:.0f}s elapsed, {int(fleet.samples.sum()):,} samples, "
+              f"{len(in_flight):,} requests in flight")
+        for stats in (lag, stored, ingest, analysis):
+            if stats.total or stats.skipped:
+                print(f"    {stats.summary()}")
+
+    print(f"🏃 Simulating {users:,} watches every {interval_minutes} min at {acceleration:g}x "
+          f"({slots} send slots per interval)")
+    started = loop.time()
+    next_report = started + SWARM_REPORT_SECONDS
+    moment = sim_start
+    tick = 0
+    try:
+        while total_slots is None or tick < total_slots:
+            due = started + tick * wall_step
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lag.observe(max(0.0, loop.time() - due))
+
+            moment = sim_start + tick * slot_step
+            slot_users = np.arange(tick % slots, users, slots)
+            tick += 1
+            columns = fleet.sample(slot_users, moment, interval_minutes)
+            deliver('health_metrics', slice_records('health_metrics', [user_ids[i] for i in slot_users], moment, columns))
+
+            sleepers = fleet.sleep_due(slot_users, moment)
+            if sleepers.size:
+                sleep = fleet.sample_sleep(sleepers, moment)
+                deliver('sleep_data', slice_records('sleep_data', [user_ids[i] for i in sleepers], moment, sleep))
+
+            if analyze_url:
+                for user in fleet.analysis_due(slot_users):
+                    submit(analysis, analyze_url, fleet.analysis_request(int(user), moment))
+
+            if loop.time() >= next_report:
+                report(moment)
+                next_report += SWARM_REPORT_SECONDS
+        if in_flight:
+            await asyncio.wait(set(in_flight))
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if client is not None:
+            await client.aclose()
+        if sink_writes:
+            await asyncio.wait(set(sink_writes))
+        report(moment)
+        if sink is not None:
+            await loop.run_in_executor(sink_thread, sink.close)
+            sink_thread.shutdown()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Smartwatch health data simulator')
+    sink_options = argparse.ArgumentParser(add_help=False)
+    sink_options.add_argument('--sink', choices=sorted(SINKS), default=None,
+                              help='batched destination (live default: firestore)')
+    sink_options.add_argument('--target', default=None,
+                              help='directory (file), database path (sqlite) or URL template (http)')
+    sink_options.add_argument('--batch-size', type=int, default=None)
+    sink_options.add_argument('--workers', type=int, default=None,
+                              help='threads committing batches (file and sqlite: 1)')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('live', parents=[sink_options], help=f"send live data for {USER_ID} (default)")
+    bulk = commands.add_parser('bulk', parents=[sink_options],
+                               help='generate history for many users to local files or a sink')
+    bulk.add_argument('--users', type=int, default=100)
+    bulk.add_argument('--days', type=int, default=30)
+    bulk.add_argument('--start', default=None, help='first day, YYYY-MM-DD (default: DAYS days ago)')
+    bulk.add_argument('--interval-minutes', type=int, default=INTERVAL_MINUTES)
+    bulk.add_argument('--seed', type=int, default=0)
+    bulk.add_argument('--chunk-size', type=int, default=BULK_USER_CHUNK, help='users generated per block')
+    bulk.add_argument('--format', choices=('npz', 'ndjson'), default='npz')
+    bulk.add_argument('--out', default='simulated_history')
+    swarm = commands.add_parser('swarm', parents=[sink_options],
+                                help='simulate many live watches in one process, e.g. as a load generator')
+    swarm.add_argument('--users', type=int, default=1000)
+    swarm.add_argument('--interval-minutes', type=int, default=INTERVAL_MINUTES)
+    swarm.add_argument('--acceleration', type=float, default=1.0,
+                       help='simulated time per wall-clock time; 1440 runs one simulated day per minute')
+    swarm.add_argument('--minutes', type=int, default=None, help='simulated minutes to run (default: until stopped)')
+    swarm.add_argument('--start', default=None, help='simulated start, ISO date or datetime (default: now)')
+    swarm.add_argument('--seed', type=int, default=0)
+    swarm.add_argument('--ingest-url', default=None,
+                       help='POST every sample from its own watch to this URL template of your own collector, '
+                            'e.g. http://localhost:9000/ingest/{collection} (the backend has no ingest endpoint)')
+    swarm.add_argument('--analyze-url', default=None,
+                       help='POST each watch\'s latest window here, e.g. http://localhost:8000/analyze-health')
+    swarm.add_argument('--analyze-every', type=int, default=60, help='simulated minutes between analysis requests')
+    swarm.add_argument('--concurrency', type=int, default=256, help='maximum open HTTP connections')
+    swarm.add_argument('--slots', type=int, default=SWARM_SLOTS, help='send times per interval')
+    args = parser.parse_args(argv)
+    sink_kind = getattr(args, 'sink', None)
+    if args.command in (None, 'live'):
+        sink_kind = sink_kind or 'firestore'
+    sink = None
+    if sink_kind:
+        try:
+            sink = make_sink(sink_kind, getattr(args, 'target', None), batch_size=getattr(args, 'batch_size', None),
+                             workers=getattr(args, 'workers', None))
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.command == 'bulk':
+        if args.start:
+            start_date = datetime.fromisoformat(args.start)
+        else:
+            start_date = datetime.now() - timedelta(days=args.days)
+        run_bulk(args.users, args.days, start_date, args.out, args.format, args.interval_minutes, args.seed,
+                 args.chunk_size, sink)
+        return
+
+    if args.command == 'swarm':
+        try:
+            asyncio.run(run_swarm(args.users, args.interval_minutes, args.acceleration, args.minutes,
+                                  datetime.fromisoformat(args.start) if args.start else None, args.seed, sink,
+                                  args.ingest_url, args.analyze_url, args.analyze_every, args.concurrency,
+                                  args.slots))
+        except KeyboardInterrupt:
+            pass
+        return
 
-            # Send sleep data once per day (morning)
-            if current_time.hour == 00 and current_time.date() != last_sleep_date:
-                sleep_data = self.generate_sleep_data(current_time)
-                self.send_to_firestore('sleep_data', sleep_data)
-                last_sleep_date = current_time.date()
+    simulator = HealthSimulator(USER_ID, sink)
+    simulator.run_simulation()
 
-            # Wait for next interval
-            time.sleep(INTERVAL_MINUTES * 60)
 
 if __name__ == "__main__":
-    simulator = HealthSimulator(USER_ID)
-    simulator.run_simulation()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,145 @@
+import json
+import threading
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pytest
+
+from backend import smartwatch_simulator as simulator
+from backend.smartwatch_simulator import FileSink, HttpSink, SQLiteSink, Sink, make_sink
+
+
+class RecordingSink(Sink):
+    name = 'recording'
+
+    def __init__(self, failures: int = 0, **options):
+        self.batches: List[List] = []
+        self.failures = failures
+        self.attempts = 0
+        self._lock = threading.Lock()
+        super().__init__(**options)
+
+    def _commit(self, batch: List):
+        with self._lock:
+            self.attempts += 1
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError('collector unavailable')
+            self.batches.append(batch)
+
+
+def _sample(user: str, minute: int) -> dict:
+    return {'userId': user, 'timestamp': datetime(2025, 1, 1, 0, minute).isoformat(), 'heartRate': 60 + minute}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(simulator, 'RETRY_BACKOFF_SECONDS', 0)
+
+
+def test_sink_is_abstract():
+    with pytest.raises(TypeError):
+        Sink()
+
+
+def test_full_batches_are_committed_and_close_flushes_the_rest():
+    sink = RecordingSink(batch_size=3, flush_interval=60)
+    for minute in range(7):
+        sink.write('health_metrics', _sample('alice', minute))
+    sink.flush()
+    assert [len(batch) for batch in sink.batches] == [3, 3, 1]
+    sink.write('health_metrics', _sample('alice', 7))
+    sink.close()
+    assert [len(batch) for batch in sink.batches] == [3, 3, 1, 1]
+    assert sink.stats.records == 8
+    assert sink.stats.batches == 4
+    record = sink.batches[0][0][1]
+    assert record['id'] == simulator.document_id(record)
+
+
+def test_partial_batch_is_committed_after_the_flush_interval():
+    sink = RecordingSink(batch_size=100, flush_interval=0.05)
+    sink.write('health_metrics', _sample('alice', 0))
+    for _ in range(100):
+        if sink.batches:
+            break
+        threading.Event().wait(0.01)
+    assert len(sink.batches) == 1
+    sink.close()
+
+
+def test_failed_batch_is_retried_then_dropped():
+    sink = RecordingSink(failures=2, batch_size=2, max_retries=2)
+    sink.write('health_metrics', _sample('alice', 0))
+    sink.write('health_metrics', _sample('alice', 1))
+    sink.flush()
+    assert sink.stats.retries == 2
+    assert sink.stats.records == 2
+
+    sink.failures = 3
+    sink.write('health_metrics', _sample('alice', 2))
+    sink.close()
+    assert sink.stats.dropped == 1
+    assert sink.stats.records == 2
+
+
+def test_single_handle_sinks_refuse_extra_workers(tmp_path):
+    with pytest.raises(ValueError):
+        FileSink(str(tmp_path), workers=2)
+    with pytest.raises(ValueError):
+        SQLiteSink(str(tmp_path / 'health.db'), workers=4)
+
+
+def test_sqlite_sink_upserts_retried_records(tmp_path):
+    path = str(tmp_path / 'health.db')
+    for _ in range(2):
+        with make_sink('sqlite', path) as sink:
+            for minute in range(5):
+                sink.write('health_metrics', _sample('alice', minute))
+    connection = simulator.sqlite3.connect(path)
+    try:
+        assert connection.execute('SELECT COUNT(*) FROM records').fetchone() == (5,)
+    finally:
+        connection.close()
+
+
+def test_http_sink_needs_a_collector_url(monkeypatch):
+    monkeypatch.setattr(simulator, 'INGEST_URL', None)
+    with pytest.raises(ValueError):
+        make_sink('http')
+    monkeypatch.setattr(simulator, 'INGEST_URL', 'http://localhost:9000/ingest/{collection}')
+    sink = make_sink('http')
+    assert sink.url == 'http://localhost:9000/ingest/{collection}'
+    sink.close()
+
+
+def _block(seed: int = 7, users: int = 3):
+    return next(simulator.generate_bulk(simulator.bulk_user_ids(users), datetime(2025, 1, 1), 1, 60, seed))
+
+
+def test_bulk_blocks_are_reproducible_for_a_seed():
+    first, again, other = _block(), _block(), _block(seed=8)
+    for field in simulator.METRIC_FIELDS:
+        assert np.array_equal(first['metrics'][field], again['metrics'][field])
+    assert not np.array_equal(first['metrics']['heartRate'], other['metrics']['heartRate'])
+
+
+def test_ndjson_lines_match_the_sink_records_and_reruns_replace_them(tmp_path):
+    block = _block()
+    for _ in range(2):
+        simulator.write_bulk_ndjson(block, str(tmp_path), append=False)
+    expected = [json.dumps(record) for collection, record in simulator.iter_bulk_records(block)
+                if collection == 'health_metrics']
+    assert (tmp_path / 'health_metrics.ndjson').read_text().splitlines() == expected
+    assert len((tmp_path / 'sleep_data.ndjson').read_text().splitlines()) == 3
+
+
+def test_npz_block_round_trips_through_np_load(tmp_path):
+    block = _block()
+    assert simulator.write_bulk_npz(block, str(tmp_path), 0) == 3 * 24
+    with np.load(tmp_path / 'metrics-2025-01-01-000.npz') as arrays:
+        assert arrays['userIds'].tolist() == block['userIds']
+        assert np.array_equal(arrays['heartRate'], block['metrics']['heartRate'])
+        assert np.array_equal(arrays['is_sleeping'], block['metrics']['is_sleeping'][0])
+        assert np.array_equal(arrays['sleep_durationHours'], block['sleep']['durationHours'])
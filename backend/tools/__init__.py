@@ -0,0 +1 @@
+"""Developer tools for the StressOFF backend (mock upstream, load and benchmark harnesses)."""
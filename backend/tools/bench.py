@@ -0,0 +1,215 @@
+"""Microbenchmarks for the backend's local (CPU-side) hot paths.
+
+Covers image compression, health metric aggregation, request validation,
+prompt building, the coach SSE re-framing and the simulator's bulk
+generator, on synthetic fixtures built from :class:`HealthSimulator` and
+generated images::
+
+    python -m backend.tools.bench --save bench_baseline.json
+    python -m backend.tools.bench --compare bench_baseline.json --threshold 0.15
+
+``--compare`` exits with status 1 when a case is slower than the baseline by
+more than the threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Callable
+
+BenchCase = tuple[str, Callable[[], object]]
+
+
+def make_image(width: int, height: int, image_format: str) -> bytes:
+    from PIL import Image
+
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **({"quality": 92} if image_format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def make_health_request(samples: int, seed: int = 7) -> dict:
+    """A ``HealthAnalysisRequest`` payload of ``samples`` per-minute metrics."""
+    from backend.smartwatch_simulator import HealthSimulator
+
+    random.seed(seed)
+    simulator = HealthSimulator("bench-user")
+    start = datetime(2025, 1, 1)
+    metrics = []
+    for minute in range(samples):
+        sample = simulator.generate_metrics(start + timedelta(minutes=minute))
+        metrics.append(
+            {
+                "timestamp": sample["timestamp"].isoformat(),
+                "heartRate": sample["heartRate"],
+                "restingHeartRate": sample["restingHeartRate"],
+                "hrv": sample["hrv"],
+                "steps": sample["steps"],
+                "calories": sample["calories"],
+                "activeMinutes": sample["activeMinutes"],
+                "spo2": sample["spo2"],
+            }
+        )
+    sleep = simulator.generate_sleep_data(start)
+    return {
+        "userId": "bench-user",
+        "date": start.date().isoformat(),
+        "metrics": metrics,
+        "sleepData": {key: sleep[key] for key in (
+            "durationHours", "qualityScore", "deepSleepMinutes", "remSleepMinutes", "lightSleepMinutes"
+        )},
+        "userProfile": {"gender": "female", "weight": 62, "goal": "General health"},
+    }
+
+
+def make_daily_request(meals: int) -> dict:
+    meal = {
+        "userId": "bench-user",
+        "mealType": "lunch",
+        "timestamp": "2025-01-01T12:30:00",
+        "dishName": "Couscous",
+        "ingredients": ["semolina", "lamb", "carrots", "zucchini"],
+        "nutrition": {"calories": 720, "proteins": 38, "carbs": 85, "fats": 24, "fibers": 11},
+        "healthAdvice": "Balanced plate",
+        "recommendation": "Add a salad",
+        "allergiesDetected": [],
+    }
+    return {"userId": "bench-user", "date": "2025-01-01", "meals": [meal] * meals}
+
+
+def make_sse_lines(tokens: int) -> list[bytes]:
+    lines = []
+    for index in range(tokens):
+        chunk = {"id": "gen", "choices": [{"index": 0, "delta": {"content": f"tok{index} "}}]}
+        lines.append(f"data: {json.dumps(chunk)}".encode())
+        lines.append(b"")
+    lines.append(b"data: [DONE]")
+    return lines
+
+
+def build_cases() -> list[BenchCase]:
+    import numpy as np
+
+    from backend.microservices.coach_service.app import _reframe_sse
+    from backend.microservices.daily_analysis_service.app import DailyAnalysisRequest, _summarize_meals
+    from backend.microservices.health_service.app import HealthAnalysisRequest, _summarize_metrics
+    from backend.microservices.meal_service.app import compress_image, create_meal_prompt
+    from backend.smartwatch_simulator import generate_bulk_day
+
+    cases: list[BenchCase] = []
+
+    for width, height in ((640, 480), (1600, 1200), (4000, 3000)):
+        for image_format in ("JPEG", "PNG", "WEBP"):
+            image = make_image(width, height, image_format)
+            cases.append((f"compress_image[{image_format}-{width}x{height}]", lambda image=image: compress_image(image)))
+
+    for samples in (60, 1440, 10080):
+        payload = make_health_request(samples)
+        request = HealthAnalysisRequest(**payload)
+        cases.append((f"validate_health_request[{samples}]", lambda payload=payload: HealthAnalysisRequest(**payload)))
+        cases.append((f"summarize_health[{samples}]", lambda request=request: _summarize_metrics(request)))
+
+    for meals in (4, 40):
+        payload = make_daily_request(meals)
+        request = DailyAnalysisRequest(**payload)
+        cases.append((f"validate_daily_request[{meals}]", lambda payload=payload: DailyAnalysisRequest(**payload)))
+        cases.append((f"summarize_daily[{meals}]", lambda request=request: _summarize_meals(request)))
+
+    profile = {"gender": "male", "weight": 80, "height": 180, "goal": "Lose weight", "allergies": ["peanuts", "gluten"]}
+    cases.append(("create_meal_prompt", lambda: create_meal_prompt(profile, "lunch", profile["allergies"])))
+
+    for tokens in (100, 500):
+        lines = make_sse_lines(tokens)
+        cases.append((f"coach_reframe_sse[{tokens}]", lambda lines=lines: list(_reframe_sse(lines))))
+
+    rng = np.random.default_rng(7)
+    for users in (100, 1000):
+        cases.append((f"simulator_bulk_day[{users}]", lambda users=users: generate_bulk_day(users, 1, rng)))
+
+    return cases
+
+
+def measure(function: Callable[[], object], repeat: int, min_time: float) -> dict:
+    """Best and median seconds per call over ``repeat`` timed batches."""
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    timings = sorted(batch / number for batch in timer.repeat(repeat=repeat, number=number))
+    return {"best": timings[0], "median": timings[len(timings) // 2], "loops": number}
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    regressions = []
+    print(f"\n{'case':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<40} {'-':>12} {_format_time(current['best']):>12} {'new':>8}")
+            continue
+        change = current["best"] / previous["best"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressions.append(name)
+        print(
+            f"{name:<40} {_format_time(previous['best']):>12} {_format_time(current['best']):>12} "
+            f"{change:>+7.1%}{flag}"
+        )
+    return regressions
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def main() -> None:  # pragma: no cover - CLI entry point
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timed batch")
+    parser.add_argument("--save", default=None, help="write results to this baseline file")
+    parser.add_argument("--compare", default=None, help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    results: dict[str, dict] = {}
+    for name, function in build_cases():
+        if args.filter not in name:
+            continue
+        results[name] = measure(function, args.repeat, args.min_time)
+        print(f"{name:<40} best {_format_time(results[name]['best']):>10}  median {_format_time(results[name]['median']):>10}")
+
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump(
+                {"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                handle,
+                indent=2,
+            )
+        print(f"\nBaseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions beyond the threshold")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,138 @@
+"""Import-time and time-to-first-request report with a budget check.
+
+Each target runs in a fresh interpreter with ``-X importtime``, so nothing is
+cached between measurements. The report shows the cumulative import time of
+the target, its heaviest imports, and the time until the app answered its
+first request::
+
+    python -m backend.tools.importtime
+    python -m backend.tools.importtime --target coach --budget-ms 900
+
+With ``--budget-ms`` the command exits with status 1 when any target's time
+to first request exceeds the budget.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Optional
+
+# name -> (module, request sent as the first request: method, path, JSON body)
+TARGETS: dict[str, tuple[str, tuple[str, str, Optional[dict]]]] = {
+    "gateway": ("backend.main", ("GET", "/", None)),
+    "gateway-coach": ("backend.main", ("POST", "/coach", {"userId": "importtime", "message": "Hello"})),
+    "coach": ("backend.microservices.coach_service.app", ("GET", "/", None)),
+    "event": ("backend.microservices.event_service.app", ("GET", "/", None)),
+    "daily": ("backend.microservices.daily_analysis_service.app", ("GET", "/", None)),
+    "health": ("backend.microservices.health_service.app", ("GET", "/", None)),
+    "meal": ("backend.microservices.meal_service.app", ("GET", "/", None)),
+}
+
+# Runs in the child interpreter: import the app, then serve one request
+# in-process. The first request on the gateway triggers lazy router loading.
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+module = __import__({module!r}, fromlist=["app"])
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client_ready = time.perf_counter()
+with TestClient(module.app) as client:
+    response = client.request({method!r}, {path!r}, json={body!r})
+answered = time.perf_counter()
+sys.stdout.write(json.dumps({{
+    "importMs": (imported - started) * 1000,
+    "firstRequestMs": (imported - started + answered - client_ready) * 1000,
+    "status": response.status_code,
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """``(module, depth, cumulative_us)`` rows from ``-X importtime`` output, in completion order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((name.strip(), (len(name) - len(name.lstrip())) // 2, int(cumulative_us)))
+        except ValueError:
+            continue  # the header line
+    return rows
+
+
+def heaviest_imports(rows: list[tuple[str, int, int]], module: str, limit: int = 8) -> list[tuple[str, float]]:
+    """Direct imports of ``module`` by cumulative milliseconds.
+
+    A module's row is printed once all its imports are done, so its direct
+    imports are the depth + 1 rows since the previous row at its own depth.
+    """
+    end = next(index for index, row in enumerate(rows) if row[0] == module)
+    depth = rows[end][1]
+    start = end
+    while start > 0 and rows[start - 1][1] > depth:
+        start -= 1
+    children = [(name, cumulative / 1000) for name, level, cumulative in rows[start:end] if level == depth + 1]
+    return sorted(children, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def measure(name: str) -> dict:
+    module, (method, path, body) = TARGETS[name]
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])),
+        # Requests that reach a handler calling OpenRouter fail fast locally
+        # instead of timing (and paying for) a real completion.
+        OPENROUTER_URL="http://127.0.0.1:9/api/v1/chat/completions",
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, method=method, path=path, body=body)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name}: probe failed\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(completed.stderr)
+    result["heaviest"] = heaviest_imports(rows, module)
+    result["modules"] = next(index for index, row in enumerate(rows) if row[0] == module) + 1
+    return result
+
+
+def main() -> None:  # pragma: no cover - CLI entry point
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", action="append", choices=sorted(TARGETS), help="defaults to every target")
+    parser.add_argument("--budget-ms", type=float, default=None, help="maximum time to first request")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = {}
+    over_budget = []
+    for name in args.target or list(TARGETS):
+        result = report[name] = measure(name)
+        flag = ""
+        if args.budget_ms is not None and result["firstRequestMs"] > args.budget_ms:
+            flag = "  OVER BUDGET"
+            over_budget.append(name)
+        print(
+            f"{name:<15} import {result['importMs']:7.0f} ms  first request {result['firstRequestMs']:7.0f} ms "
+            f"(HTTP {result['status']}, {result['modules']} modules){flag}"
+        )
+        for module, cumulative_ms in result["heaviest"]:
+            print(f"    {cumulative_ms:7.1f} ms  {module}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as handle:
+            json.dump(report, handle, indent=2)
+    if over_budget:
+        print(f"\n{len(over_budget)} target(s) over the {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
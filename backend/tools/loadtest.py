@@ -0,0 +1,394 @@
+"""End-to-end load harness for the StressOFF gateway.
+
+Drives ``backend/main.py`` with a weighted mix of realistic requests (meal
+uploads, 1,440-sample health payloads, long coach streams, daily summaries,
+event recommendations) and reports p50/p95/p99 latency, throughput and the
+gateway's RSS. Run it against the mock upstream::
+
+    python -m backend.tools.loadtest --spawn --duration 60 --concurrency 32
+
+``--spawn`` starts the mock OpenRouter and the gateway as subprocesses;
+otherwise ``--base-url`` (and optionally ``--gateway-pid`` for RSS) target an
+already running gateway. Requires ``httpx``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Optional
+
+import httpx
+
+DEFAULT_MIX = "meal=2,health=2,coach=2,daily=1,event=1"
+
+
+def percentile(values: list[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of ``pid`` and its children, from /proc (Linux only)."""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as handle:
+            pids += [int(child) for child in handle.read().split()]
+    except OSError:
+        pass
+    for current in pids:
+        try:
+            with open(f"/proc/{current}/status") as handle:
+                for line in handle:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total or None
+
+
+def make_meal_image(width: int = 1600, height: int = 1200) -> bytes:
+    """A noisy JPEG the size of a phone photo, so compression does real work."""
+    from PIL import Image
+
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def make_health_payload(user_id: str, samples: int = 1440) -> dict:
+    start = datetime(2025, 1, 1)
+    metrics = []
+    for minute in range(samples):
+        metrics.append(
+            {
+                "timestamp": (start + timedelta(minutes=minute)).isoformat(),
+                "heartRate": round(random.gauss(70, 8), 1),
+                "restingHeartRate": round(random.gauss(60, 1), 1),
+                "hrv": round(random.gauss(50, 6), 1),
+                "steps": random.randint(0, 120),
+                "calories": round(random.uniform(1.2, 4.0), 1),
+                "activeMinutes": random.randint(0, 1),
+                "spo2": round(random.gauss(97, 0.5), 1),
+            }
+        )
+    return {
+        "userId": user_id,
+        "date": start.date().isoformat(),
+        "metrics": metrics,
+        "sleepData": {
+            "durationHours": 7.2,
+            "qualityScore": 78,
+            "deepSleepMinutes": 70,
+            "remSleepMinutes": 100,
+            "lightSleepMinutes": 260,
+        },
+        "userProfile": {"gender": "female", "weight": 62, "goal": "General health"},
+    }
+
+
+def make_daily_payload(user_id: str) -> dict:
+    meal = {
+        "userId": user_id,
+        "timestamp": "2025-01-01T12:30:00",
+        "dishName": "Couscous",
+        "ingredients": ["semolina", "lamb", "carrots"],
+        "nutrition": {"calories": 720, "proteins": 38, "carbs": 85, "fats": 24, "fibers": 11},
+        "healthAdvice": "Balanced",
+        "recommendation": "Add a salad",
+    }
+    meals = [dict(meal, mealType=meal_type) for meal_type in ("breakfast", "lunch", "snack", "dinner")]
+    return {"userId": user_id, "date": "2025-01-01", "meals": meals}
+
+
+def make_coach_payload(user_id: str, turns: int = 20) -> dict:
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"Question {turn}: what should I eat before a workout?"})
+        history.append({"role": "assistant", "content": "A light snack with carbs and some protein works well. " * 3})
+    return {
+        "userId": user_id,
+        "message": "Can you suggest a Tunisian breakfast for a busy day?",
+        "userProfile": {"gender": "male", "weight": 80, "height": 180, "goal": "Lose weight"},
+        "conversationHistory": history,
+    }
+
+
+class StreamFailed(Exception):
+    """A 200 event stream that reported an error or ended without ``[DONE]``."""
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.first_bytes: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def ok(self, scenario: str, latency: float, first_byte: Optional[float] = None) -> None:
+        self.latencies[scenario].append(latency)
+        if first_byte is not None:
+            self.first_bytes[scenario].append(first_byte)
+
+    def error(self, scenario: str, reason: str) -> None:
+        self.errors[scenario][reason] += 1
+
+
+class Scenarios:
+    def __init__(self, client: httpx.AsyncClient, users: int) -> None:
+        self.client = client
+        self.users = [f"load-user-{index}" for index in range(users)]
+        self.meal_image = make_meal_image()
+        self.health_payloads = [make_health_payload(user) for user in self.users[:8]]
+
+    def user(self) -> str:
+        return random.choice(self.users)
+
+    async def meal(self) -> tuple[httpx.Response, Optional[float]]:
+        response = await self.client.post(
+            "/analyze-meal",
+            data={"userId": self.user(), "mealType": "lunch", "userProfile": json.dumps({"goal": "Lose weight"})},
+            files={"image": ("meal.jpg", self.meal_image, "image/jpeg")},
+        )
+        return response, None
+
+    async def health(self) -> tuple[httpx.Response, Optional[float]]:
+        payload = dict(random.choice(self.health_payloads), userId=self.user())
+        return await self.client.post("/analyze-health", json=payload), None
+
+    async def daily(self) -> tuple[httpx.Response, Optional[float]]:
+        return await self.client.post("/analyze-daily", json=make_daily_payload(self.user())), None
+
+    async def event(self) -> tuple[httpx.Response, Optional[float]]:
+        payload = {
+            "eventTitle": "Team presentation",
+            "startTime": "2025-01-01T10:00:00",
+            "endTime": "2025-01-01T11:00:00",
+        }
+        return await self.client.post("/generate-event-recommendation", json=payload), None
+
+    async def coach(self) -> tuple[httpx.Response, Optional[float]]:
+        """Stream a coach answer; upstream failures arrive as ``{"error": ...}`` events in a 200."""
+        started = time.perf_counter()
+        first_byte = None
+        finished = False
+        failed = False
+        async with self.client.stream("POST", "/coach", json=make_coach_payload(self.user())) as response:
+            async for line in response.aiter_lines():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):].strip()
+                if data == "[DONE]":
+                    finished = True
+                    continue
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(event, dict) and "error" in event:
+                    failed = True
+        if response.status_code < 400 and (failed or not finished):
+            raise StreamFailed()
+        return response, first_byte
+
+
+async def worker(scenarios: Scenarios, mix: list[tuple[str, int]], recorder: Recorder, deadline: float) -> None:
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    while time.monotonic() < deadline:
+        scenario = random.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            response, first_byte = await getattr(scenarios, scenario)()
+        except httpx.HTTPError as exc:
+            recorder.error(scenario, type(exc).__name__)
+            continue
+        except StreamFailed:
+            recorder.error(scenario, "stream-error")
+            continue
+        latency = time.perf_counter() - started
+        if response.status_code >= 400:
+            recorder.error(scenario, str(response.status_code))
+        else:
+            recorder.ok(scenario, latency, first_byte)
+
+
+async def sample_rss(pid: Optional[int], samples: list[int], stop: asyncio.Event) -> None:
+    if pid is None:
+        return
+    while not stop.is_set():
+        rss = read_rss_bytes(pid)
+        if rss:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args: argparse.Namespace, gateway_pid: Optional[int]) -> dict:
+    mix = []
+    for item in args.mix.split(","):
+        name, _, weight = item.partition("=")
+        if weight and int(weight) > 0:
+            mix.append((name.strip(), int(weight)))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        scenarios = Scenarios(client, args.users)
+        recorder = Recorder()
+        rss_samples: list[int] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(gateway_pid, rss_samples, stop))
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(scenarios, mix, recorder, deadline) for _ in range(args.concurrency)))
+        elapsed = time.monotonic() - started
+        stop.set()
+        await sampler
+
+    report: dict = {"durationSeconds": round(elapsed, 2), "concurrency": args.concurrency, "scenarios": {}}
+    total_ok = 0
+    for name, _ in mix:
+        latencies = recorder.latencies.get(name, [])
+        total_ok += len(latencies)
+        entry = {
+            "ok": len(latencies),
+            "errors": dict(recorder.errors.get(name, {})),
+            "throughputPerSecond": round(len(latencies) / elapsed, 2),
+            "p50Ms": _ms(percentile(latencies, 50)),
+            "p95Ms": _ms(percentile(latencies, 95)),
+            "p99Ms": _ms(percentile(latencies, 99)),
+        }
+        if recorder.first_bytes.get(name):
+            entry["firstByteP50Ms"] = _ms(percentile(recorder.first_bytes[name], 50))
+            entry["firstByteP95Ms"] = _ms(percentile(recorder.first_bytes[name], 95))
+        report["scenarios"][name] = entry
+    report["throughputPerSecond"] = round(total_ok / elapsed, 2)
+    if rss_samples:
+        report["rssMiB"] = {
+            "start": round(rss_samples[0] / 2**20, 1),
+            "max": round(max(rss_samples) / 2**20, 1),
+            "end": round(rss_samples[-1] / 2**20, 1),
+        }
+    return report
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 1) if value is not None else None
+
+
+def print_report(report: dict) -> None:
+    print(f"\nDuration {report['durationSeconds']}s, concurrency {report['concurrency']}, "
+          f"throughput {report['throughputPerSecond']} req/s")
+    header = f"{'scenario':<8} {'ok':>6} {'err':>5} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb p50':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, entry in report["scenarios"].items():
+        errors = sum(entry["errors"].values())
+        print(
+            f"{name:<8} {entry['ok']:>6} {errors:>5} {entry['throughputPerSecond']:>7} "
+            f"{_fmt(entry['p50Ms']):>9} {_fmt(entry['p95Ms']):>9} {_fmt(entry['p99Ms']):>9} "
+            f"{_fmt(entry.get('firstByteP50Ms')):>9}"
+        )
+        if entry["errors"]:
+            print(f"{'':<8} errors: {entry['errors']}")
+    if "rssMiB" in report:
+        rss = report["rssMiB"]
+        print(f"\nGateway RSS: start {rss['start']} MiB, max {rss['max']} MiB, end {rss['end']} MiB")
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _wait_until_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn_stack(args: argparse.Namespace) -> list[subprocess.Popen]:
+    """Start the mock upstream and the gateway as subprocesses."""
+    mock = subprocess.Popen(
+        [
+            sys.executable, "-m", "backend.tools.mock_openrouter",
+            "--port", str(args.mock_port),
+            "--latency-ms", str(args.mock_latency_ms),
+            "--token-rate", str(args.mock_token_rate),
+            "--error-429", str(args.mock_error_429),
+            "--error-5xx", str(args.mock_error_5xx),
+        ]
+    )
+    _wait_until_up(f"http://127.0.0.1:{args.mock_port}/")
+    env = dict(os.environ, OPENROUTER_URL=f"http://127.0.0.1:{args.mock_port}/api/v1/chat/completions")
+    gateway = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+         "--port", str(args.gateway_port), "--log-level", "warning"],
+        env=env,
+    )
+    args.base_url = f"http://127.0.0.1:{args.gateway_port}"
+    _wait_until_up(f"{args.base_url}/")
+    return [mock, gateway]
+
+
+def main() -> None:  # pragma: no cover - CLI entry point
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent virtual clients")
+    parser.add_argument("--users", type=int, default=500, help="distinct user ids to spread load over")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted scenarios, e.g. meal=2,health=2,coach=1")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--gateway-pid", type=int, default=None, help="pid to sample RSS from")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--spawn", action="store_true", help="start the mock upstream and gateway locally")
+    parser.add_argument("--gateway-port", type=int, default=8800)
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--mock-latency-ms", type=float, default=800.0)
+    parser.add_argument("--mock-token-rate", type=float, default=40.0)
+    parser.add_argument("--mock-error-429", type=float, default=0.0)
+    parser.add_argument("--mock-error-5xx", type=float, default=0.0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    processes: list[subprocess.Popen] = []
+    gateway_pid = args.gateway_pid
+    try:
+        if args.spawn:
+            processes = spawn_stack(args)
+            gateway_pid = processes[-1].pid
+        report = asyncio.run(run(args, gateway_pid))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,249 @@
+"""Local stand-in for the OpenRouter ``/chat/completions`` API.
+
+Speaks the JSON and SSE streaming shapes the services parse, with a
+configurable latency distribution, token rate, 429/5xx injection and canned
+JSON bodies per route. Point the backend at it with::
+
+    python -m backend.tools.mock_openrouter --port 8900 --latency-ms 800
+    OPENROUTER_URL=http://127.0.0.1:8900/api/v1/chat/completions uvicorn backend.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 800.0
+    latency_sigma: float = 0.4
+    token_rate: float = 40.0
+    error_429: float = 0.0
+    error_5xx: float = 0.0
+    retry_after: int = 2
+    seed: int | None = None
+
+
+config = MockConfig()
+_random = random.Random()
+
+CANNED_MEAL = {
+    "dishName": "Couscous with lamb and vegetables",
+    "ingredients": ["semolina", "lamb", "carrots", "zucchini", "chickpeas", "harissa"],
+    "nutrition": {"calories": 720, "proteins": 38, "carbs": 85, "fats": 24, "fibers": 11},
+    "healthAdvice": "A balanced plate with good protein; watch the portion of semolina if your goal is weight loss.",
+    "recommendation": "Add a side salad and reduce the oil used in the broth.",
+    "allergiesDetected": [],
+}
+
+CANNED_BODIES = {
+    "meal": CANNED_MEAL,
+    "meal-batch": {"meals": [CANNED_MEAL]},
+    "health": {
+        "summary": "Your recovery is good with a stable resting heart rate.",
+        "action": "Take a 20-minute brisk walk after lunch.",
+        "breakfastSuggestion": "Oatmeal with fruit and a yogurt.",
+        "indicatorToWatch": "HRV",
+        "sleepRemark": "Your sleep quality was good. Let's start a day with a protein-rich breakfast 💪",
+        "sleepPractices": "- Keep a regular bedtime\n- Avoid screens one hour before sleep",
+    },
+    "daily": {
+        "globalAdvice": "Your intake is close to the recommended targets with enough protein.",
+        "recommendations": "Add more fibers through vegetables and legumes.",
+        "needsMet": True,
+    },
+    "event": {
+        "practices": ["Take three deep breaths", "Review your key points", "Drink a glass of water"],
+        "nutritionSuggestion": "A yogurt with nuts for steady energy.",
+        "purpose": "Deliver a focused and confident presentation.",
+    },
+    "coach": (
+        "Great question! A Mediterranean breakfast such as whole grain bread with olive oil, "
+        "tomatoes and a boiled egg gives you lasting energy. Pair it with a glass of water "
+        "and a short walk to start your day feeling light and focused."
+    ),
+}
+
+
+def _detect_route(payload: dict) -> str:
+    """Guess which service sent the request from the prompt it contains."""
+    messages = payload.get("messages") or []
+    text_parts: list[str] = []
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            text_parts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    text_parts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+    text = "\n".join(text_parts)
+    if images:
+        return "meal-batch" if '"meals"' in text else "meal"
+    if "health AI coach" in text:
+        return "health"
+    if "AI nutritionist" in text:
+        return "daily"
+    if "Calendar Event" in text:
+        return "event"
+    return "coach"
+
+
+def _content_for(route: str, payload: dict) -> str:
+    body = CANNED_BODIES[route]
+    if route == "meal-batch":
+        text = "\n".join(
+            part.get("text", "")
+            for message in payload.get("messages", [])
+            for part in (message.get("content") if isinstance(message.get("content"), list) else [])
+            if part.get("type") == "text"
+        )
+        count = max(1, text.count("- Image "))
+        body = {"meals": [CANNED_MEAL] * count}
+    return body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)
+
+
+def _sample_latency() -> float:
+    """Lognormal latency around ``latency_ms`` (the median)."""
+    if config.latency_ms <= 0:
+        return 0.0
+    return _random.lognormvariate(math.log(config.latency_ms / 1000), config.latency_sigma)
+
+
+def _injected_error() -> JSONResponse | None:
+    draw = _random.random()
+    if draw < config.error_429:
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded: free-models-per-min", "code": 429}},
+            status_code=429,
+            headers={"Retry-After": str(config.retry_after)},
+        )
+    if draw < config.error_429 + config.error_5xx:
+        return JSONResponse(
+            {"error": {"message": "Provider returned error", "code": 502}},
+            status_code=_random.choice([500, 502, 503]),
+        )
+    return None
+
+
+def _usage(payload: dict, content: str) -> dict:
+    prompt_tokens = len(json.dumps(payload.get("messages", []))) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Mock OpenRouter")
+
+    @app.post("/api/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "mock/model")
+        route = _detect_route(payload)
+        content = _content_for(route, payload)
+        completion_id = f"gen-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        await asyncio.sleep(_sample_latency())
+        error = _injected_error()
+        if error is not None:
+            return error
+
+        if not payload.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": _usage(payload, content),
+            }
+
+        async def generate():
+            delay = 1 / config.token_rate if config.token_rate > 0 else 0.0
+            for start in range(0, len(content), 4):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + 4]}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if delay:
+                    await asyncio.sleep(delay)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": _usage(payload, content),
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.get("/")
+    async def root() -> dict:
+        return {"message": "Mock OpenRouter", "config": config.__dict__}
+
+    return app
+
+
+app = create_app()
+
+
+def main() -> None:  # pragma: no cover - CLI entry point
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms, help="median upstream latency")
+    parser.add_argument("--latency-sigma", type=float, default=config.latency_sigma, help="lognormal sigma")
+    parser.add_argument("--token-rate", type=float, default=config.token_rate, help="streamed tokens per second")
+    parser.add_argument("--error-429", type=float, default=config.error_429, help="share of 429 responses")
+    parser.add_argument("--error-5xx", type=float, default=config.error_5xx, help="share of 5xx responses")
+    parser.add_argument("--retry-after", type=int, default=config.retry_after)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.latency_sigma = args.latency_sigma
+    config.token_rate = args.token_rate
+    config.error_429 = args.error_429
+    config.error_5xx = args.error_5xx
+    config.retry_after = args.retry_after
+    config.seed = args.seed
+    _random.seed(args.seed)
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()